@@ -0,0 +1,141 @@
+"""
+Measures the overhead of naoqi_interfaces without a robot using the fake NAOqi backend:
+
+    python benchmarks/bench_events.py
+
+Reports events per second and callback latency percentiles for the different delivery modes of the EventManager, the
+startup time for many event classes, and the memory used per event class instance.
+"""
+import naoqi_interfaces.testing.fake_naoqi as fake_naoqi
+robot = fake_naoqi.install()
+
+from naoqi_interfaces.events.event_abstractclass import EventAbstractclass
+from naoqi_interfaces.control.event_manager import EventManager
+from naoqi_interfaces.control.dispatcher import Dispatcher, BLOCK
+import naoqi_interfaces.control.stats as stats
+import argparse
+import contextlib
+import gc
+import os
+import resource
+import sys
+import time
+
+EVENT = "Benchmark/Event"
+
+
+class LatencyEvent(EventAbstractclass):
+    def __init__(self, *args, **kwargs):
+        super(LatencyEvent, self).__init__(*args, **kwargs)
+        self.latencies = []
+
+    def callback(self, *args, **kwargs):
+        # The payload is the time the event was raised
+        self.latencies.append(time.time() - args[1])
+
+
+def percentile(values, p):
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100. * (len(values) - 1))))]
+
+
+@contextlib.contextmanager
+def quiet():
+    # The EventManager prints status messages which would clutter the results
+    stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+    try:
+        yield
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+
+def create_manager(events, **kwargs):
+    with quiet():
+        return EventManager(globals(), "127.0.0.1", 9559, events, auto_reconnect=False, **kwargs)
+
+
+def shutdown_manager(manager):
+    with quiet():
+        report = manager.shutdown()
+    if report["timed_out"] or report["failed"]:
+        print "Warning: Shutdown incomplete, timed out: %s, failed: %s" % (
+            ", ".join(report["timed_out"]), ", ".join(report["failed"]))
+    robot.reset()
+    stats.collector.enabled = False
+    stats.collector.reset()
+
+
+def bench_throughput(name, num_events, num_handlers, **kwargs):
+    events = [LatencyEvent(event=EVENT, proxy_name=None) for _ in range(num_handlers)]
+    manager = create_manager(events, **kwargs)
+    start = time.time()
+    for _ in range(num_events):
+        robot.memory.raiseEvent(EVENT, time.time())
+    deadline = time.time() + 10.
+    while sum(len(e.latencies) for e in events) < num_events * num_handlers and time.time() < deadline:
+        time.sleep(.001)
+    duration = time.time() - start
+    latencies = [l for e in events for l in e.latencies]
+    shutdown_manager(manager)
+    print "%-32s %10.0f ev/s  p50 %8.1f us  p99 %8.1f us  max %8.1f us  (%d callbacks)" % (
+        name, num_events / duration, percentile(latencies, 50) * 1e6, percentile(latencies, 99) * 1e6,
+        max(latencies) * 1e6 if latencies else float("nan"), len(latencies))
+
+
+def bench_startup(num_classes, latency):
+    robot.latency = latency
+    events = [LatencyEvent(event="%s/%d" % (EVENT, i), proxy_name="ALModule%d" % (i % 5)) for i in range(num_classes)]
+    start = time.time()
+    manager = create_manager(events)
+    duration = time.time() - start
+    robot.latency = 0.
+    shutdown_manager(manager)
+    print "%-32s %10.3f s  (%d classes, %.1f ms per call)" % (
+        "startup", duration, num_classes, latency * 1e3)
+
+
+def resident_memory():
+    """
+    :return: The current resident memory of this process in kB. Falls back to the peak if /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize() / 1024.
+    except IOError:
+        # ru_maxrss is in kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def bench_memory(num_classes):
+    gc.collect()
+    before = resident_memory()
+    events = [LatencyEvent(event="%s/%d" % (EVENT, i), proxy_name=None) for i in range(num_classes)]
+    manager = create_manager(events)
+    gc.collect()
+    after = resident_memory()
+    shutdown_manager(manager)
+    print "%-32s %10.2f kB per instance  (%d classes)" % ("memory", (after - before) / float(num_classes), num_classes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--events", type=int, default=20000,
+                        help="Number of events raised per throughput benchmark")
+    parser.add_argument("-c", "--classes", type=int, default=200,
+                        help="Number of event classes for the startup and memory benchmarks")
+    parser.add_argument("-l", "--latency", type=float, default=.001,
+                        help="Simulated round trip time in seconds for the startup benchmark")
+    args = parser.parse_args()
+
+    bench_memory(args.classes)
+    bench_throughput("direct, 1 handler", args.events, 1, use_event_bus=False)
+    bench_throughput("event bus, 1 handler", args.events, 1)
+    bench_throughput("direct, 10 handlers", args.events, 10, use_event_bus=False)
+    bench_throughput("event bus, 10 handlers", args.events, 10)
+    bench_throughput("dispatcher, 1 handler", args.events, 1, dispatcher=Dispatcher(workers=2, policy=BLOCK))
+    bench_throughput("dispatcher, 10 handlers", args.events, 10, dispatcher=Dispatcher(workers=2, policy=BLOCK))
+    bench_throughput("event bus, 1 handler, stats", args.events, 1, collect_stats=True)
+    bench_startup(args.classes, args.latency)
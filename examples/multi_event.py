@@ -1,5 +1,6 @@
 from naoqi_interfaces.events.multi_event_abstractclass import MultiEventAbstractclass, Event
 from naoqi_interfaces.control.event_manager import EventManager
+from naoqi_interfaces.comms.memory_accessor import person_keys
 import argparse
 import time
 
@@ -38,6 +39,9 @@ class MultiEvent(MultiEventAbstractclass):
                 "PeoplePerception/Person/" + str(person_id) + "/HeadAngles")
         except RuntimeError:
             print "No gaze information"
+        # Reading several keys for all people with a single call. Keys that do not exist return the default.
+        person_ids = [p[0] for p in args[1][1]]
+        print "Distances and head angles:", self.get_memory_data(person_keys(person_ids, ["Distance", "HeadAngles"]))
 
     def callback_gaze(self, *args, **kwargs):
         # This callback doesn't do anything. We just need to subscribe to gaze analysis to make sure it is running so we
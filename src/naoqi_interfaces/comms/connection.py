@@ -1,9 +1,29 @@
 from naoqi import ALBroker
+import naoqi_interfaces.comms.proxy_registry as proxies
+import random
+import threading
 import time
+import traceback
 import uuid
 
 
-def create_broker(ip, port, target_ip="0.0.0.0", target_port=0):
+def backoff_delay(attempt, backoff=1., max_backoff=30., jitter=.5):
+    """
+    Computes the time to wait before the next connection attempt. The delay doubles with every attempt up to
+    max_backoff and is randomised by up to +/- jitter * delay so many clients do not retry at the same time.
+
+    :param attempt: The number of failed attempts so far, starting at 0
+    :param backoff: The delay after the first failed attempt in seconds
+    :param max_backoff: The maximum delay in seconds
+    :param jitter: The fraction of the delay used for randomisation
+    :return: The delay in seconds
+    """
+    delay = min(max_backoff, backoff * 2 ** min(attempt, 32))
+    return max(0., delay + random.uniform(-jitter, jitter) * delay)
+
+
+def create_broker(ip, port, target_ip="0.0.0.0", target_port=0, max_retries=None, backoff=1., max_backoff=30.,
+                  jitter=.5, is_shutdown=None, timeout=None):
     """
     creates a broker that takes care of the connection between the modules. Call this function in the main file.
 
@@ -11,26 +31,191 @@ def create_broker(ip, port, target_ip="0.0.0.0", target_port=0):
     :param port: The port to connect to, usually the port of the robot
     :param target_ip: IP to listen to
     :param target_port: Port to use
+    :param max_retries: Optional argument. The number of retries after which a RuntimeError is raised. If omitted,
+    it retries until the connection succeeds.
+    :param backoff: The time in seconds to wait after the first failed attempt. Doubles with every attempt.
+    :param max_backoff: The maximum time in seconds to wait between two attempts
+    :param jitter: The fraction of the waiting time used for randomisation
+    :param is_shutdown: Optional function without arguments. Retrying is aborted with a RuntimeError when it returns
+    True.
+    :param timeout: Optional argument. The time in seconds after which retrying is given up with a RuntimeError. If
+    omitted, only `max_retries` limits retrying.
     :return: The broker instance. Keep this alive in your main file.
     """
-    name = str(uuid.uuid4())
-    try:
-        broker = ALBroker(name,
-                          target_ip,  # listen to anyone
-                          target_port,  # find a free port and use it
-                          ip,  # parent broker IP
-                          port)
-        print "Connected to %s:%s" % (ip, str(port))
-        return broker
-    except RuntimeError:
-        print "Cannot connect to %s:%s. Retrying in 1 second." % (ip, str(port))
-        time.sleep(1)
-        return create_broker(ip, port, target_ip=target_ip, target_port=target_port)
+    deadline = None if timeout is None else time.time() + timeout
+    attempt = 0
+    while True:
+        name = str(uuid.uuid4())
+        try:
+            broker = ALBroker(name,
+                              target_ip,  # listen to anyone
+                              target_port,  # find a free port and use it
+                              ip,  # parent broker IP
+                              port)
+            print "Connected to %s:%s" % (ip, str(port))
+            return broker
+        except RuntimeError:
+            if max_retries is not None and attempt >= max_retries:
+                raise RuntimeError("Cannot connect to %s:%s after %d retries." % (ip, str(port), attempt))
+            if deadline is not None and time.time() >= deadline:
+                raise RuntimeError("Cannot connect to %s:%s within %.1f seconds." % (ip, str(port), timeout))
+            delay = backoff_delay(attempt, backoff, max_backoff, jitter)
+            if deadline is not None:
+                delay = min(delay, deadline - time.time())
+            print "Cannot connect to %s:%s. Retrying in %.1f seconds." % (ip, str(port), delay)
+            attempt += 1
+            end = time.time() + delay
+            while time.time() < end:
+                if is_shutdown is not None and is_shutdown():
+                    raise RuntimeError("Connecting to %s:%s was aborted." % (ip, str(port)))
+                time.sleep(min(.1, max(0., end - time.time())))
 
 
-def shutdown_broker(broker):
+def shutdown_broker(broker, registry=None):
     """
     Terminates connection and shuts down the broker. Call in destructor or before ending your script
     :param broker: The broker instance created with create_broker
+    :param registry: Optional argument. The ProxyRegistry of the robot. If omitted, the process wide registry is used.
     """
     broker.shutdown()
+    # The shared proxies belong to this broker and cannot be used anymore
+    (proxies.registry if registry is None else registry).invalidate()
+
+
+class ConnectionSupervisor(object):
+    """
+    Keeps the connection to the robot alive. Creates the broker, checks periodically whether the robot can still be
+    reached, and rebuilds the broker if it cannot. After a successful reconnect, all shared proxies are dropped so
+    they are created again on next use and all functions registered via `on_reconnect` are called, e.g. to subscribe
+    to the events again.
+
+    :param ip: The IP to connect to. Usually the IP of the robot.
+    :param port: The port to connect to, usually the port of the robot
+    :param target_ip: IP to listen to
+    :param target_port: Port to use
+    :param check_interval: The time in seconds between two connection checks
+    :param backoff: The time in seconds to wait after the first failed connection attempt. Doubles with every attempt.
+    :param max_backoff: The maximum time in seconds to wait between two connection attempts
+    :param jitter: The fraction of the waiting time used for randomisation
+    :param registry: Optional argument. The ProxyRegistry of the robot. If omitted, the process wide registry is used.
+    """
+    def __init__(self, ip, port, target_ip="0.0.0.0", target_port=0, check_interval=1., backoff=1., max_backoff=30.,
+                 jitter=.5, registry=None):
+        self.ip = ip
+        self.port = port
+        self.target_ip = target_ip
+        self.target_port = target_port
+        self.check_interval = check_interval
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.jitter = jitter
+        self.registry = proxies.registry if registry is None else registry
+        self.broker = None
+        self.reconnects = 0
+        self.__memory = None
+        self.__on_reconnect = []
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def connect(self, timeout=None):
+        """
+        Creates the broker. Blocks until the connection succeeds, the timeout passed, or `stop` is called.
+
+        :param timeout: Optional argument. The time in seconds after which connecting is given up. If omitted, it
+        retries until the connection succeeds. Reconnects always retry until they succeed.
+        :return: The broker instance
+        :raises RuntimeError: If the connection could not be established
+        """
+        self.broker = create_broker(self.ip, self.port, self.target_ip, self.target_port, backoff=self.backoff,
+                                    max_backoff=self.max_backoff, jitter=self.jitter, is_shutdown=self.__stop.is_set,
+                                    timeout=timeout)
+        try:
+            self.__memory = self.registry.create("ALMemory")
+        except RuntimeError:
+            self.__memory = None
+        return self.broker
+
+    def is_alive(self):
+        """
+        :return: True if the robot can be reached via the current broker
+        """
+        try:
+            if self.__memory is None:
+                self.__memory = self.registry.create("ALMemory")
+            self.__memory.ping()
+            return True
+        except RuntimeError:
+            self.__memory = None
+            return False
+
+    def reconnect(self):
+        """
+        Shuts down the current broker, creates a new one, and calls all functions registered via `on_reconnect`.
+        Blocks until the connection succeeds or `stop` is called.
+        """
+        print "Lost connection to %s:%s. Reconnecting." % (self.ip, str(self.port))
+        if self.broker is not None:
+            try:
+                shutdown_broker(self.broker, self.registry)
+            except RuntimeError as e:
+                print "Warning:", e
+        self.registry.invalidate()
+        self.broker = None
+        try:
+            self.connect()
+        except RuntimeError:
+            if self.__stop.is_set():
+                return
+            raise
+        self.reconnects += 1
+        for f in self.__on_reconnect:
+            try:
+                f()
+            except Exception:
+                print "Exception in reconnect function:"
+                traceback.print_exc()
+
+    def on_reconnect(self, *args):
+        """
+        Register functions that are called after the broker was rebuilt. These functions cannot have arguments and are
+        executed in order on the thread of the supervisor.
+
+        :param args: The function(s) to be called after a reconnect.
+        """
+        self.__on_reconnect.extend(args)
+
+    def _supervise(self):
+        while not self.__stop.wait(self.check_interval):
+            if not self.is_alive() and not self.__stop.is_set():
+                self.reconnect()
+
+    def start(self):
+        """
+        Starts checking the connection in the background. Call `connect` first.
+        """
+        if self.__thread is not None:
+            return
+        self.__stop.clear()
+        self.__thread = threading.Thread(target=self._supervise, name="connection-supervisor")
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops checking the connection. Does not shut down the broker.
+
+        :param timeout: Optional argument. Maximum time in seconds to wait for the supervisor thread to finish.
+        """
+        self.__stop.set()
+        thread, self.__thread = self.__thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def shutdown(self):
+        """
+        Stops checking the connection and shuts down the broker.
+        """
+        self.stop(timeout=1.)
+        if self.broker is not None:
+            shutdown_broker(self.broker, self.registry)
+            self.broker = None
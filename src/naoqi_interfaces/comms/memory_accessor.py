@@ -0,0 +1,165 @@
+import threading
+import time
+
+PERSON_KEY = "PeoplePerception/Person/%s/%s"
+
+_RAISE = object()
+
+
+def person_key(person_id, field):
+    """
+    Creates the memory key for a value of a person detected by ALPeoplePerception.
+
+    :param person_id: The ID of the person as published by the PeoplePerception events
+    :param field: The name of the value, e.g. "Distance" or "HeadAngles"
+    :return: The memory key, e.g. "PeoplePerception/Person/12345/Distance"
+    """
+    return PERSON_KEY % (str(person_id), field)
+
+
+def person_keys(person_ids, fields):
+    """
+    Creates the memory keys for several values of several people. Keys are ordered by person first and then by field.
+
+    :param person_ids: A list of person IDs
+    :param fields: A list of value names, e.g. ["Distance", "HeadAngles"]
+    :return: The list of memory keys
+    """
+    return [person_key(p, f) for p in person_ids for f in fields]
+
+
+class MemoryAccessor(object):
+    """
+    Reads values from ALMemory in batches. All keys requested together are read with a single `getListData` call
+    instead of one `getData` call each. Values can optionally be cached for a short time so repeated reads of the same
+    key, e.g. in several callbacks handling the same event, do not need to ask the robot again.
+
+    :param memory: The ALMemory proxy
+    :param ttl: The default time in seconds a value is cached. 0 disables caching.
+    :param max_size: The number of cached values after which expired values are removed from the cache.
+    """
+    def __init__(self, memory, ttl=0., max_size=1000):
+        self.memory = memory
+        self.ttl = ttl
+        self.max_size = max_size
+        self.ttls = {}
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__cache = {}
+
+    def set_ttl(self, key, ttl):
+        """
+        Overrides the default caching time for a single key.
+
+        :param key: The memory key
+        :param ttl: The time in seconds the value is cached. 0 disables caching for this key. None resets to default.
+        """
+        if ttl is None:
+            self.ttls.pop(key, None)
+        else:
+            self.ttls[key] = ttl
+
+    def get_data(self, key, ttl=None, default=_RAISE):
+        """
+        Reads a single key. See `get_list_data`.
+
+        :param key: The memory key
+        :param ttl: Optional argument. Maximum age in seconds of a cached value to be used for this read.
+        :param default: Optional argument. Returned if the key does not exist. If omitted, a RuntimeError is raised.
+        :return: The value
+        """
+        return self.get_list_data([key], ttl=ttl, default=default)[0]
+
+    def get_list_data(self, keys, ttl=None, default=_RAISE):
+        """
+        Reads a list of keys. Keys that are in the cache and younger than their ttl are taken from there, all others
+        are read from the robot with a single call.
+
+        :param keys: A list of memory keys
+        :param ttl: Optional argument. Maximum age in seconds of a cached value to be used for this read. If omitted,
+        the ttl set for the key or the default ttl is used.
+        :param default: Optional argument. Returned for keys that do not exist. If omitted, a RuntimeError is raised if
+        any of the keys does not exist.
+        :return: The list of values in the same order as the keys
+        """
+        now = time.time()
+        values = [None] * len(keys)
+        missing = []
+        with self.__lock:
+            for i, key in enumerate(keys):
+                max_age = ttl if ttl is not None else self.ttls.get(key, self.ttl)
+                if max_age > 0 and key in self.__cache:
+                    stamp, value = self.__cache[key]
+                    if now - stamp <= max_age:
+                        values[i] = value
+                        self.hits += 1
+                        continue
+                missing.append(i)
+            self.misses += len(missing)
+        if not missing:
+            return values
+
+        missing_keys = [keys[i] for i in missing]
+        try:
+            fetched = self.memory.getListData(missing_keys)
+        except RuntimeError:
+            if default is _RAISE:
+                raise
+            # At least one key does not exist. Fall back to single reads to find out which.
+            fetched = []
+            for key in missing_keys:
+                try:
+                    fetched.append(self.memory.getData(key))
+                except RuntimeError:
+                    fetched.append(default)
+
+        with self.__lock:
+            for i, value in zip(missing, fetched):
+                values[i] = value
+                if (ttl if ttl is not None else self.ttls.get(keys[i], self.ttl)) > 0:
+                    self.__cache[keys[i]] = (now, value)
+            if len(self.__cache) > self.max_size:
+                self._evict(now)
+        return values
+
+    def _evict(self, now):
+        """
+        Removes all values that are older than the longest configured ttl, e.g. values of people that are gone.
+        Has to be called with the lock held.
+        """
+        max_age = max([self.ttl] + self.ttls.values())
+        for key in [k for k, v in self.__cache.items() if now - v[0] > max_age]:
+            del self.__cache[key]
+
+    def get_person_data(self, person_ids, fields, ttl=None, default=_RAISE):
+        """
+        Reads several values for several people detected by ALPeoplePerception with a single call.
+
+        :param person_ids: A list of person IDs
+        :param fields: A list of value names, e.g. ["Distance", "HeadAngles"]
+        :param ttl: Optional argument. See `get_list_data`.
+        :param default: Optional argument. See `get_list_data`.
+        :return: A dictionary mapping each person ID to a dictionary mapping each field to its value
+        """
+        values = iter(self.get_list_data(person_keys(person_ids, fields), ttl=ttl, default=default))
+        return dict((p, dict((f, next(values)) for f in fields)) for p in person_ids)
+
+    def invalidate(self, key=None):
+        """
+        Removes values from the cache.
+
+        :param key: Optional argument. If omitted, the whole cache is cleared.
+        """
+        with self.__lock:
+            if key is None:
+                self.__cache.clear()
+            else:
+                self.__cache.pop(key, None)
+
+    def stats(self):
+        """
+        :return: A dictionary with the number of cache hits and misses and the hit rate
+        """
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / float(total) if total else 0.}
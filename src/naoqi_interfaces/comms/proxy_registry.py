@@ -0,0 +1,132 @@
+from naoqi import ALProxy
+import threading
+import time
+
+
+class ProxyRegistry(object):
+    """
+    A process wide registry of proxies. Every proxy is created lazily the first time it is requested and then shared
+    between all the events and service proxies that use it. Bound methods of the proxies are cached as well so calls
+    via `ServiceProxy` do not have to look them up every time.
+
+    :param retry_interval: Time in seconds to wait before retrying to create a proxy whose module is not running, yet.
+    :param ip: Optional argument. The IP of the robot. If omitted, proxies are created via the broker of the process.
+    Used to talk to several robots from one process, see naoqi_interfaces.control.fleet_manager.
+    :param port: Optional argument. The port of the robot. Only used together with `ip`.
+    """
+    def __init__(self, retry_interval=1., ip=None, port=None):
+        self.retry_interval = retry_interval
+        self.ip = ip
+        self.port = port
+        self.__lock = threading.Lock()
+        self.__creation_locks = {}
+        self.__proxies = {}
+        self.__methods = {}
+
+    def get_proxy(self, proxy_name, is_shutdown=None):
+        """
+        Returns the shared proxy for the given name and creates it if it does not exist, yet. If the module providing
+        the proxy is not running, this blocks and retries until it is or until `is_shutdown` returns True.
+
+        :param proxy_name: The name of the proxy as a string, e.g. ALFaceDetection
+        :param is_shutdown: Optional function without arguments. Creation is aborted when it returns True.
+        :return: The proxy object or None if creation was aborted
+        """
+        if not isinstance(proxy_name, str):
+            raise TypeError("Proxy names have to be string objects.")
+        try:
+            return self.__proxies[proxy_name]
+        except KeyError:
+            pass
+
+        with self.__lock:
+            creation_lock = self.__creation_locks.setdefault(proxy_name, threading.Lock())
+        # Only one thread creates a given proxy, all the others wait for it and then share the result.
+        with creation_lock:
+            if proxy_name in self.__proxies:
+                return self.__proxies[proxy_name]
+            while is_shutdown is None or not is_shutdown():
+                try:
+                    proxy = self.create(proxy_name)
+                    break
+                except RuntimeError:
+                    print "Server '%s' could not be found. Maybe it is not running, yet. Retrying." % proxy_name
+                    time.sleep(self.retry_interval)
+            else:
+                return None
+            self.__proxies[proxy_name] = proxy
+            return proxy
+
+    def create(self, proxy_name):
+        """
+        Creates a new proxy that is not shared.
+
+        :param proxy_name: The name of the proxy as a string, e.g. ALMemory
+        :return: The proxy object
+        :raises RuntimeError: If the module is not running
+        """
+        if self.ip is None:
+            return ALProxy(proxy_name)
+        return ALProxy(proxy_name, self.ip, int(self.port))
+
+    def get_method(self, proxy_name, method_name):
+        """
+        Returns the bound method `method_name` of the shared proxy `proxy_name`. The lookup is cached.
+
+        :param proxy_name: The name of the proxy as a string, e.g. ALAnimatedSpeech
+        :param method_name: The name of the method, e.g. say
+        :return: The bound method
+        """
+        try:
+            return self.__methods[(proxy_name, method_name)]
+        except KeyError:
+            method = getattr(self.get_proxy(proxy_name), method_name)
+            self.__methods[(proxy_name, method_name)] = method
+            return method
+
+    def has_proxy(self, proxy_name):
+        """
+        :param proxy_name: The name of the proxy as a string
+        :return: True if the proxy has already been created
+        """
+        return proxy_name in self.__proxies
+
+    def invalidate(self, proxy_name=None):
+        """
+        Drops cached proxies and methods so they are created again on next use, e.g. after the broker was recreated.
+
+        :param proxy_name: Optional argument. If omitted, all proxies are dropped.
+        """
+        with self.__lock:
+            if proxy_name is None:
+                self.__proxies.clear()
+                self.__methods.clear()
+            else:
+                self.__proxies.pop(proxy_name, None)
+                for key in [k for k in self.__methods if k[0] == proxy_name]:
+                    del self.__methods[key]
+
+
+registry = ProxyRegistry()
+
+
+def get_proxy(proxy_name, is_shutdown=None):
+    """
+    Returns the shared proxy from the process wide registry. See `ProxyRegistry.get_proxy`.
+
+    :param proxy_name: The name of the proxy as a string, e.g. ALFaceDetection
+    :param is_shutdown: Optional function without arguments. Creation is aborted when it returns True.
+    :return: The proxy object or None if creation was aborted
+    """
+    return registry.get_proxy(proxy_name, is_shutdown)
+
+
+def get_method(proxy_name, method_name):
+    """
+    Returns a cached bound method of a shared proxy from the process wide registry. See `ProxyRegistry.get_method`.
+
+    :param proxy_name: The name of the proxy as a string, e.g. ALAnimatedSpeech
+    :param method_name: The name of the method, e.g. say
+    :return: The bound method
+    """
+    return registry.get_method(proxy_name, method_name)
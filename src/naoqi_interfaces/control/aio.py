@@ -0,0 +1,264 @@
+"""
+An asyncio front-end for the EventManager and ServiceProxy. Requires asyncio (or trollius on Python 2). Payloads are
+handed from the NAOqi callback threads to the event loop via `call_soon_threadsafe`:
+
+    aio = AsyncEventManager(manager)
+
+    @trollius.coroutine
+    def greet():
+        speech = aio.service("ALTextToSpeech")
+        stream = aio.events("FaceDetected")
+        while True:
+            payload = yield trollius.From(stream.get())
+            yield trollius.From(speech.say("Hello"))
+
+    aio.run(greet())
+
+On Python 3, streams can also be consumed with `async for payload in stream`.
+"""
+from collections import deque
+from naoqi_interfaces.services.service_proxy import ServiceProxy
+import threading
+
+try:
+    import asyncio
+except ImportError:
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+try:
+    _StopAsyncIteration = StopAsyncIteration
+except NameError:
+    _StopAsyncIteration = StopIteration
+
+
+class EventStream(object):
+    """
+    The payloads of one event as an asynchronous iterator. Only use from the event loop thread. If the consumer falls
+    behind by more than `maxsize` payloads, the oldest ones are discarded.
+
+    :param loop: The event loop
+    :param event: The name of the event
+    :param maxsize: The maximum number of payloads to buffer
+    :param on_close: Function called with the stream when it is closed
+    """
+    def __init__(self, loop, event, maxsize=100, on_close=None):
+        self.loop = loop
+        self.event = event
+        self.dropped = 0
+        self.__items = deque(maxlen=maxsize)
+        self.__waiter = None
+        self.__closed = False
+        self.__on_close = on_close
+
+    def _put(self, value):
+        if self.__closed:
+            return
+        if self.__waiter is not None and not self.__waiter.done():
+            self.__waiter.set_result(value)
+            self.__waiter = None
+            return
+        if len(self.__items) == self.__items.maxlen:
+            self.dropped += 1
+        self.__items.append(value)
+
+    def get(self):
+        """
+        :return: An awaitable resolving to the next payload. Raises StopAsyncIteration if the stream is closed.
+        """
+        future = asyncio.Future(loop=self.loop)
+        if self.__items:
+            future.set_result(self.__items.popleft())
+        elif self.__closed:
+            future.set_exception(_StopAsyncIteration())
+        else:
+            if self.__waiter is not None and not self.__waiter.done():
+                raise RuntimeError("Only one consumer can wait on an event stream at a time.")
+            self.__waiter = future
+        return future
+
+    def __aiter__(self):
+        return self
+
+    def __anext__(self):
+        return self.get()
+
+    def close(self):
+        """
+        Stops the stream. Waiting consumers finish their iteration.
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+        if self.__waiter is not None and not self.__waiter.done():
+            self.__waiter.set_exception(_StopAsyncIteration())
+        self.__waiter = None
+        if self.__on_close is not None:
+            self.__on_close(self)
+
+
+class _Subscription(object):
+    """
+    Keeps an event subscribed on the event bus while streams of it are open. The payloads themselves reach the streams
+    via the observer of the EventManager.
+    """
+    def __init__(self, name):
+        self._name = name
+
+    def _deliver(self, event, args):
+        pass
+
+
+class AioServiceProxy(ServiceProxy):
+    def __init__(self, proxy_name, loop, executor=None, registry=None):
+        """
+        A ServiceProxy whose calls return awaitables. The blocking calls are executed by the given executor so the
+        event loop is never blocked by a round trip to the robot.
+
+        :param proxy_name: The name of the proxy to create, e.g. ALAnimatedSpeech
+        :param loop: The event loop
+        :param executor: Optional argument. The executor for the calls. If omitted, the default executor of the loop is
+        used.
+        :param registry: Optional argument. The ProxyRegistry of the robot. If omitted, the process wide registry is used.
+        """
+        super(AioServiceProxy, self).__init__(proxy_name, registry)
+        self.loop = loop
+        self.executor = executor
+
+    def __getattr__(self, item):
+        method = super(AioServiceProxy, self).__getattr__(item)
+        if item == self.proxy_name:
+            return method
+
+        def call(*args):
+            return self.loop.run_in_executor(self.executor, method, *args)
+        call.__name__ = item
+        return call
+
+
+class AsyncEventManager(object):
+    """
+    Makes the events of an EventManager available as asynchronous iterators and runs the event loop instead of `spin`.
+
+    :param manager: The EventManager
+    :param loop: Optional argument. The event loop. If omitted, the current event loop is used.
+    """
+    def __init__(self, manager, loop=None):
+        if asyncio is None:
+            raise ImportError("The asyncio front-end requires asyncio or trollius.")
+        self.manager = manager
+        if loop is None:
+            try:
+                loop = asyncio.get_event_loop()
+            except RuntimeError:
+                loop = asyncio.new_event_loop()
+                asyncio.set_event_loop(loop)
+        self.loop = loop
+        self.__lock = threading.Lock()
+        self.__streams = {}
+        self.__subscriptions = {}
+        self.__stopped = asyncio.Future(loop=self.loop)
+        manager.add_observer(self._on_event)
+        manager.on_shutdown(self._on_shutdown)
+
+    def events(self, event, maxsize=100):
+        """
+        Creates a stream of the payloads of an event. If no event class of the manager is subscribed to this event, it
+        is subscribed via the event bus of the manager while the stream is open.
+
+        :param event: The name of the event, e.g. "PeoplePerception/PeopleDetected"
+        :param maxsize: The maximum number of payloads to buffer if the consumer falls behind
+        :return: An EventStream. Use with `async for payload in stream`. Payloads are the values published by NAOqi.
+        """
+        stream = EventStream(self.loop, event, maxsize, on_close=self._remove_stream)
+        with self.__lock:
+            streams = self.__streams.get(event, ())
+            self.__streams[event] = streams + (stream,)
+            if not streams and self.manager.event_bus is not None:
+                subscription = _Subscription("aio_%s" % event)
+                self.manager.event_bus.add(event, subscription)
+                self.__subscriptions[event] = subscription
+        return stream
+
+    def _remove_stream(self, stream):
+        with self.__lock:
+            streams = tuple(s for s in self.__streams.get(stream.event, ()) if s is not stream)
+            if streams:
+                self.__streams[stream.event] = streams
+                return
+            self.__streams.pop(stream.event, None)
+            subscription = self.__subscriptions.pop(stream.event, None)
+        # The event bus removes all subscriptions itself on shutdown
+        if subscription is not None and not self.__stopped.done():
+            try:
+                self.manager.event_bus.remove(stream.event, subscription)
+            except RuntimeError as e:
+                print "Warning:", e
+
+    def _on_event(self, event, args):
+        # Called on the NAOqi callback thread
+        if event in self.__streams:
+            self.loop.call_soon_threadsafe(self._dispatch, event, args[1])
+
+    def _dispatch(self, event, value):
+        for stream in self.__streams.get(event, ()):
+            stream._put(value)
+
+    def service(self, proxy_name, executor=None):
+        """
+        :param proxy_name: The name of the proxy, e.g. ALAnimatedSpeech
+        :param executor: Optional argument. The executor for the blocking calls. If omitted, the default executor of
+        the loop is used.
+        :return: An AioServiceProxy whose calls can be awaited. Talks to the robot of the EventManager.
+        """
+        return AioServiceProxy(proxy_name, self.loop, executor, self.manager.registry)
+
+    def _on_shutdown(self):
+        # Called by the EventManager, possibly from a signal handler
+        self.loop.call_soon_threadsafe(self._finish)
+
+    def _finish(self):
+        if not self.__stopped.done():
+            self.__stopped.set_result(None)
+        with self.__lock:
+            streams = [s for streams in self.__streams.values() for s in streams]
+        for stream in streams:
+            stream.close()
+
+    def stopped(self):
+        """
+        :return: An awaitable that resolves once the manager shuts down
+        """
+        return self.__stopped
+
+    def run(self, *coroutines):
+        """
+        Runs the event loop until Ctrl+C is received or all given coroutines have finished, then shuts down the
+        manager. Replaces `EventManager.spin`. The tasks added via `EventManager.add_task` are executed meanwhile on a
+        thread of the default executor of the loop.
+
+        :param coroutines: Coroutines or awaitables to run
+        """
+        scheduler = self.loop.run_in_executor(None, self.manager.scheduler.run)
+        tasks = [asyncio.ensure_future(c, loop=self.loop) for c in coroutines]
+        waiting = [self.__stopped]
+        if tasks:
+            waiting.append(asyncio.gather(*tasks))
+        try:
+            self.loop.run_until_complete(asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED))
+        finally:
+            if not self.__stopped.done():
+                self.manager.shutdown()
+            self.loop.run_until_complete(self.__stopped)
+            # Stopped by the shutdown of the manager
+            self.loop.run_until_complete(scheduler)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            if tasks:
+                self.loop.run_until_complete(asyncio.wait(tasks))
+            for task in tasks:
+                if not task.cancelled() and task.exception() is not None:
+                    raise task.exception()
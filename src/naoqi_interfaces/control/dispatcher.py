@@ -0,0 +1,214 @@
+from collections import deque
+import naoqi_interfaces.control.profiler as profiling
+import naoqi_interfaces.control.stats as stats
+import threading
+import time
+import traceback
+
+# Overflow policies for the per event queues
+BLOCK = "block"  # The NAOqi callback thread waits until there is space in the queue
+DROP_OLDEST = "drop_oldest"  # The oldest queued payload is discarded to make room for the new one
+DROP_NEWEST = "drop_newest"  # The new payload is discarded if the queue is full
+COALESCE = "coalesce"  # Only the latest payload is kept, all older queued payloads are discarded
+
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, COALESCE)
+
+
+class EventQueue(object):
+    """
+    A bounded queue for a single event. Not thread safe on its own, all access is guarded by the lock of the
+    Dispatcher that owns it.
+
+    :param key: The key identifying the queue, usually a tuple of (module name, event name)
+    :param maxsize: The maximum number of payloads to keep
+    :param policy: What to do if a payload arrives while the queue is full. One of the policies defined in this module.
+    """
+    def __init__(self, key, maxsize, policy):
+        if policy not in POLICIES:
+            raise ValueError("Unknown overflow policy '%s'. Has to be one of %s" % (policy, ", ".join(POLICIES)))
+        if maxsize < 1:
+            raise ValueError("maxsize has to be at least 1")
+        self.key = key
+        self.policy = policy
+        self.maxsize = 1 if policy == COALESCE else maxsize
+        self.items = deque()
+        self.scheduled = False
+        self.received = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def full(self):
+        return len(self.items) >= self.maxsize
+
+
+class Dispatcher(object):
+    """
+    Runs event callbacks on a pool of worker threads instead of the NAOqi callback thread. Every event gets its own
+    bounded queue and the workers serve the queues round robin, one payload at a time. Hence, an event that fires at a
+    high rate cannot starve events that fire rarely. Payloads of the same event are always handled in order and never
+    concurrently.
+
+    :param workers: The number of worker threads
+    :param maxsize: The default maximum length of the per event queues
+    :param policy: The default overflow policy of the per event queues
+    """
+    def __init__(self, workers=2, maxsize=100, policy=DROP_OLDEST):
+        if workers < 1:
+            raise ValueError("The dispatcher needs at least one worker")
+        if policy not in POLICIES:
+            raise ValueError("Unknown overflow policy '%s'. Has to be one of %s" % (policy, ", ".join(POLICIES)))
+        self.workers = workers
+        self.maxsize = maxsize
+        self.policy = policy
+        self.__cond = threading.Condition()
+        self.__queues = {}
+        self.__ready = deque()
+        self.__threads = []
+        self.__running = False
+
+    def register(self, key, policy=None, maxsize=None):
+        """
+        Creates or reconfigures the queue for an event. Events that are not registered explicitly get a queue with the
+        default settings on their first payload.
+
+        :param key: The key identifying the queue, usually a tuple of (module name, event name)
+        :param policy: Optional argument. The overflow policy. If omitted, the default of the dispatcher is used.
+        :param maxsize: Optional argument. The maximum queue length. If omitted, the default of the dispatcher is used.
+        """
+        # Validates the settings
+        queue = EventQueue(
+            key,
+            self.maxsize if maxsize is None else maxsize,
+            self.policy if policy is None else policy
+        )
+        with self.__cond:
+            old = self.__queues.get(key)
+            if old is None:
+                self.__queues[key] = queue
+                return
+            # A worker may hold the existing queue while it runs a callback, so it is reconfigured in place. Replacing
+            # it would leave the new queue marked as scheduled without ever being put back into the ready list.
+            old.policy, old.maxsize = queue.policy, queue.maxsize
+            while len(old.items) > old.maxsize:
+                old.items.popleft()
+                old.dropped += 1
+
+    def submit(self, key, func, args):
+        """
+        Puts a payload into the queue of the given event. Called from the NAOqi callback thread.
+
+        :param key: The key identifying the queue, usually a tuple of (module name, event name)
+        :param func: The callback to execute
+        :param args: The list of arguments for the callback
+        :return: True if the payload was queued, False if it was dropped
+        """
+        with self.__cond:
+            try:
+                queue = self.__queues[key]
+            except KeyError:
+                queue = self.__queues[key] = EventQueue(key, self.maxsize, self.policy)
+            queue.received += 1
+            if not self.__running:
+                queue.dropped += 1
+                return False
+            if queue.full():
+                if queue.policy == BLOCK:
+                    while self.__running and self.__queues.get(key) is queue and queue.full():
+                        self.__cond.wait()
+                    if not self.__running or self.__queues.get(key) is not queue:
+                        queue.dropped += 1
+                        return False
+                elif queue.policy == DROP_NEWEST:
+                    queue.dropped += 1
+                    return False
+                else:
+                    # DROP_OLDEST and COALESCE
+                    queue.dropped += len(queue.items) - queue.maxsize + 1
+                    while queue.full():
+                        queue.items.popleft()
+            queue.items.append((func, args, time.time()))
+            if not queue.scheduled:
+                queue.scheduled = True
+                self.__ready.append(queue)
+                self.__cond.notify_all()
+            return True
+
+    def _work(self):
+        while True:
+            with self.__cond:
+                while self.__running and not self.__ready:
+                    self.__cond.wait()
+                if not self.__running:
+                    return
+                queue = self.__ready.popleft()
+                func, args, enqueued = queue.items.popleft()
+                # Wake up callback threads blocked on a full queue
+                self.__cond.notify_all()
+            try:
+                if profiling.profiler.enabled:
+                    profiling.profiler.run("event:%s" % str(queue.key[-1]), stats.call_callback, queue.key[-1], func,
+                                           args, enqueued)
+                elif stats.collector.enabled:
+                    stats.collector.call_callback(queue.key[-1], func, args, enqueued)
+                else:
+                    func(*args)
+            except Exception:
+                print "Exception in callback for '%s':" % str(queue.key[-1])
+                traceback.print_exc()
+            with self.__cond:
+                if queue.items:
+                    # Back to the end of the line so all other events get their turn first
+                    self.__ready.append(queue)
+                    self.__cond.notify_all()
+                else:
+                    queue.scheduled = False
+
+    def start(self):
+        """
+        Starts the worker threads. Does nothing if they are already running.
+        """
+        with self.__cond:
+            if self.__running:
+                return
+            self.__running = True
+            self.__threads = [threading.Thread(target=self._work, name="dispatcher-%d" % i)
+                              for i in range(self.workers)]
+        for t in self.__threads:
+            t.daemon = True
+            t.start()
+
+    def is_running(self):
+        """
+        :return: True if the worker threads have been started and not stopped
+        """
+        return self.__running
+
+    def stop(self, timeout=None):
+        """
+        Stops the worker threads. Payloads that are still queued are discarded.
+
+        :param timeout: Optional argument. Maximum time in seconds to wait for each worker to finish its callback.
+        """
+        with self.__cond:
+            self.__running = False
+            for queue in self.__queues.values():
+                queue.dropped += len(queue.items)
+                queue.items.clear()
+                queue.scheduled = False
+            self.__ready.clear()
+            self.__cond.notify_all()
+            threads, self.__threads = self.__threads, []
+        for t in threads:
+            if t is not threading.current_thread():
+                t.join(timeout)
+
+    def queue_stats(self):
+        """
+        :return: A dictionary mapping the queue keys to a dictionary with the current length, number of received and
+        number of dropped payloads.
+        """
+        with self.__cond:
+            return dict((k, {"length": len(q), "received": q.received, "dropped": q.dropped})
+                        for k, q in self.__queues.items())
@@ -0,0 +1,128 @@
+from naoqi_interfaces.events.event_abstractclass import EventAbstractclass
+import threading
+import traceback
+
+
+class EventBus(EventAbstractclass):
+    """
+    An in-process event bus that holds a single NAOqi subscription per event name and hands every payload to all the
+    event classes that subscribed to this event. Subscriptions are reference counted: the first event class subscribing
+    to an event creates the NAOqi subscription and the last one unsubscribing removes it. Hence, NAOqi only has to
+    serialise and deliver every payload once, no matter how many event classes use it.
+
+    Created and managed by the EventManager.
+
+    :param name: Option argument. Can be used to define an explicit name fo the global variable that holds the
+    instance of the bus.
+    """
+    def __init__(self, name=""):
+        super(EventBus, self).__init__(event=None, proxy_name=None, name=name)
+        self.__lock = threading.Lock()
+        self.__event_locks = {}
+        self.__handlers = {}
+
+    def callback(self, *args, **kwargs):
+        # Overriding this from EventAbstractclass. The bus only uses on_event.
+        return
+
+    def _event_lock(self, event):
+        # Subscribing in NAOqi is a round trip to the robot, so only calls for the same event wait for each other
+        with self.__lock:
+            return self.__event_locks.setdefault(event, threading.Lock())
+
+    def add(self, event, handler):
+        """
+        Registers an event class for an event. Subscribes to the event in NAOqi if this is the first handler.
+
+        :param event: The name of the event, e.g. "FaceDetected"
+        :param handler: The instance of a class inheriting from EventAbstractclass
+        """
+        with self._event_lock(event):
+            handlers = self.__handlers.get(event, ())
+            if handler in handlers:
+                return
+            if not handlers:
+                self.__memory__.subscribeToEvent(
+                    event,
+                    self._name,
+                    self.on_event.func_name
+                )
+                self._subscriptions[event] = self.on_event.func_name
+            with self.__lock:
+                # Copy on write so on_event can iterate without holding the lock
+                self.__handlers[event] = handlers + (handler,)
+
+    def remove(self, event, handler):
+        """
+        Removes an event class from an event. Unsubscribes from the event in NAOqi if this was the last handler.
+
+        :param event: The name of the event, e.g. "FaceDetected"
+        :param handler: The instance of a class inheriting from EventAbstractclass
+        """
+        with self._event_lock(event):
+            handlers = self.__handlers.get(event, ())
+            if handler not in handlers:
+                raise RuntimeError("'%s' is not subscribed to '%s'" % (handler._name, event))
+            handlers = tuple(h for h in handlers if h is not handler)
+            with self.__lock:
+                if handlers:
+                    self.__handlers[event] = handlers
+                    return
+                del self.__handlers[event]
+                self._subscriptions.pop(event, None)
+            self.__memory__.unsubscribeToEvent(
+                event,
+                self._name
+            )
+
+    def subscriptions(self):
+        """
+        :return: A dictionary mapping event names to the number of event classes subscribed to them
+        """
+        with self.__lock:
+            return dict((e, len(h)) for e, h in self.__handlers.items())
+
+    def on_event(self, *args):
+        """
+        Called by NAOqi whenever one of the subscribed events fires. Hands the payload to all registered event classes.
+
+        :param args: The event name, the value, and the subscriber identifier as given by NAOqi
+        """
+        # A failing handler must not keep the payload from the other handlers
+        for observer in self._observers:
+            try:
+                observer(args[0], args)
+            except Exception:
+                print "Exception in observer for '%s':" % str(args[0])
+                traceback.print_exc()
+        for handler in self.__handlers.get(args[0], ()):
+            try:
+                handler._deliver(args[0], args)
+            except Exception:
+                print "Exception in callback for '%s':" % str(args[0])
+                traceback.print_exc()
+
+    def start(self):
+        # Subscriptions are created by the event classes via `add`
+        pass
+
+    def stop(self):
+        """
+        Removes all NAOqi subscriptions of the bus. The subscriptions are removed concurrently, one thread each.
+        """
+        with self.__lock:
+            events, self.__handlers = self.__handlers.keys(), {}
+            self._subscriptions.clear()
+
+        def unsubscribe(event):
+            try:
+                self.__memory__.unsubscribeToEvent(event, self._name)
+            except RuntimeError as e:
+                print "Warning:", e
+
+        threads = [threading.Thread(target=unsubscribe, args=(event,)) for event in events]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
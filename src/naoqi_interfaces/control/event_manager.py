@@ -1,6 +1,18 @@
 import signal
+import threading
 import time
+import traceback
 import naoqi_interfaces.comms.connection as con
+import naoqi_interfaces.comms.proxy_registry as proxies
+from naoqi_interfaces.control.event_bus import EventBus
+from naoqi_interfaces.control.scheduler import Scheduler
+from naoqi_interfaces.control.sampler import Sampler
+from naoqi_interfaces.control.recorder import EventRecorder, replay
+from naoqi_interfaces.control.fanout import Publisher
+from naoqi_interfaces.events.history import EventHistory
+import naoqi_interfaces.control.profiler as profiling
+import naoqi_interfaces.control.stats as stats
+from naoqi_interfaces.services.service_proxy import ServiceProxy
 
 
 class EventManager(object):
@@ -17,49 +29,625 @@ class EventManager(object):
     from the abstract class). You are free to mix.
     :param target_ip: IP to listen to
     :param target_port: Port to use
+    :param dispatcher: Optional argument. An instance of naoqi_interfaces.control.dispatcher.Dispatcher. If given, the
+    callbacks of all events are executed on its worker threads instead of the NAOqi callback thread.
+    :param use_event_bus: If True, every event name is only subscribed to once in NAOqi and the payloads are handed to
+    all the events subscribed to it locally. If False, every event subscribes in NAOqi itself.
+    :param startup_timeout: Optional argument. The time in seconds to wait for all events to be initialised and
+    started. Events are started concurrently and wait for the modules they need to be running. If omitted, the
+    constructor blocks until all events are started.
+    :param partial_start: If True, the constructor returns after `startup_timeout` even if some events are not ready,
+    yet. These keep waiting for their modules in the background and are started as soon as they are ready. If False,
+    the events started so far, the worker threads, and the broker are stopped and a RuntimeError is raised if not all
+    events are started in time.
+    :param auto_reconnect: If True, the connection to the robot is checked every `check_interval` seconds. If it is
+    lost, the broker is rebuilt and all proxies and subscriptions are restored.
+    :param check_interval: The time in seconds between two connection checks
+    :param collect_stats: If True, the duration of every callback and ServiceProxy call is recorded. See `stats`.
+    :param registry: Optional argument. The naoqi_interfaces.comms.proxy_registry.ProxyRegistry used by the events of
+    this manager. If omitted, the process wide registry is used. Used to talk to several robots from one process.
+    :param install_signal_handler: If True, Ctrl+C shuts down this manager. Set to False if several managers run in
+    one process or if the manager is not created on the main thread, and call `shutdown` yourself.
+    :param shutdown_timeout: The maximum time in seconds the shutdown may take. Steps that take longer, e.g.
+    unsubscribing from a robot that cannot be reached, are abandoned and reported. See `shutdown`.
+    :param connect_timeout: Optional argument. The time in seconds after which connecting to the robot is given up and
+    the constructor raises a RuntimeError. If omitted, it retries until the connection succeeds.
+    :param profile: If True, the stacks of all callbacks and tasks are sampled from the start. See `start_profiling`.
     """
-    def __init__(self, globals_, ip, port, events=None, target_ip="0.0.0.0", target_port=0, auto_start=True):
+    def __init__(self, globals_, ip, port, events=None, target_ip="0.0.0.0", target_port=0, auto_start=True,
+                 dispatcher=None, use_event_bus=True, startup_timeout=None, partial_start=False, auto_reconnect=True,
+                 check_interval=1., collect_stats=False, registry=None, install_signal_handler=True,
+                 shutdown_timeout=5., profile=False, connect_timeout=None):
         self.auto_start = auto_start
+        self.dispatcher = dispatcher
+        # A dispatcher that is already running is shared with other managers and stopped by its owner
+        self.__owns_dispatcher = dispatcher is not None and not dispatcher.is_running()
         self.globals_ = globals_
-        self.broker = con.create_broker(ip, port, target_ip, target_port)
+        self.registry = proxies.registry if registry is None else registry
+        self.supervisor = con.ConnectionSupervisor(ip, port, target_ip, target_port, check_interval=check_interval,
+                                                   registry=self.registry)
+        self.supervisor.connect(timeout=connect_timeout)
+        self.supervisor.on_reconnect(self._on_reconnect)
+        self.event_bus = EventBus() if use_event_bus else None
+        self.scheduler = Scheduler()
+        self.sampler = Sampler(registry=self.registry)
+        if collect_stats:
+            stats.collector.enabled = True
+        self.__profiling = False
+        if profile:
+            self.start_profiling()
+        self.startup_timeout = startup_timeout
+        self.partial_start = partial_start
+        self.__readiness = {}
+        self.__readiness_cond = threading.Condition()
         self.__on_shutdown = []
+        self.__observers = []
+        self.__histories = {}
+        self.recorder = None
+        self.publisher = None
         self.events = events if isinstance(events, (list, tuple)) else [events] if events is not None else []
+        self.shutdown_timeout = shutdown_timeout
         self.__shutdown_requested = False
+        self.__shutdown_lock = threading.Lock()
+        self.__shutting_down = False
+        self.__shutdown_done = threading.Event()
+        self.__shutdown_report = None
         self.__start()
-        signal.signal(signal.SIGINT, self._signal_handler)
+        if auto_reconnect:
+            self.supervisor.start()
+        if install_signal_handler:
+            signal.signal(signal.SIGINT, self._signal_handler)
+
+    @property
+    def broker(self):
+        return self.supervisor.broker
 
     def __start(self):
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+        if self.event_bus is not None:
+            self.event_bus.set_registry(self.registry)
+            self.event_bus.add_observer(self._on_event)
+            self.event_bus.initialise_proxies_and_memory(self.globals_)
+        self.__start_threads = []
         for event in self.events:
-            if isinstance(event, (tuple, list)):
-                event[0].initialise_proxies_and_memory(self.globals_)
-                event[0].init(*(event[1] if isinstance(event[1], (tuple, list)) else [event[1]]))
-                if self.auto_start: event[0].start()
+            instance = event[0] if isinstance(event, (tuple, list)) else event
+            instance.set_registry(self.registry)
+            if self.dispatcher is not None:
+                instance.set_dispatcher(self.dispatcher)
+            if self.event_bus is not None:
+                instance.set_event_bus(self.event_bus)
+            else:
+                instance.add_observer(self._on_event)
+            args = (event[1] if isinstance(event[1], (tuple, list)) else [event[1]]) \
+                if isinstance(event, (tuple, list)) else []
+            self.__set_state(instance, "pending")
+            self.__start_threads.append(threading.Thread(target=self.__start_event, args=(instance, args)))
+        # Events are started concurrently so one event waiting for its module does not hold up the others
+        for t in self.__start_threads:
+            t.daemon = True
+            t.start()
+        self.__wait_for_startup()
+
+    def __start_event(self, instance, args):
+        try:
+            self.__set_state(instance, "initialising")
+            instance.initialise_proxies_and_memory(self.globals_)
+            if instance.is_cancelled():
+                return
+            instance.init(*args)
+            if instance.is_cancelled():
+                return
+            if self.auto_start:
+                self.__set_state(instance, "starting")
+                instance.start()
+                self.__set_state(instance, "started")
             else:
-                event.initialise_proxies_and_memory(self.globals_)
-                event.init()
-                if self.auto_start: event.start()
+                self.__set_state(instance, "ready")
+        except Exception as e:
+            print "Failed to start '%s':" % instance.__class__.__name__
+            traceback.print_exc()
+            self.__set_state(instance, "failed", e)
+
+    def __set_state(self, instance, state, error=None):
+        with self.__readiness_cond:
+            self.__readiness[instance._name] = {
+                "class": instance.__class__.__name__,
+                "state": state,
+                "error": error,
+                "time": time.time()
+            }
+            self.__readiness_cond.notify_all()
+
+    def __wait_for_startup(self):
+        deadline = None if self.startup_timeout is None else time.time() + self.startup_timeout
+        with self.__readiness_cond:
+            while not self.__startup_finished():
+                timeout = None if deadline is None else deadline - time.time()
+                if timeout is not None and timeout <= 0:
+                    break
+                # Waiting with a timeout keeps the main thread responsive to Ctrl+C
+                self.__readiness_cond.wait(1. if timeout is None else min(timeout, 1.))
+            not_ready = dict((k, v) for k, v in self.__readiness.items() if v["state"] not in ("started", "ready"))
+        if not not_ready:
+            return
+        summary = ", ".join("%s (%s): %s" % (v["class"], k, v["state"]) for k, v in not_ready.items())
+        if self.partial_start and not any(v["state"] == "failed" for v in not_ready.values()):
+            print "Not all events are ready, yet. Starting them in the background: %s" % summary
+        else:
+            self.__abort_startup()
+            raise RuntimeError("Events could not be started: %s" % summary)
+
+    def __abort_startup(self):
+        # The constructor raises, so nobody can call `shutdown`. Without this, the start threads keep retrying to
+        # create their proxies and the broker stays alive.
+        self.__shutdown_requested = True
+        deadline = time.time() + self.shutdown_timeout
+        instances = [event[0] if isinstance(event, (tuple, list)) else event for event in self.events]
+        for instance in instances:
+            instance.cancel()
+        with self.__readiness_cond:
+            started = [i for i in instances if self.__readiness[i._name]["state"] == "started"]
+        steps = [("%s (%s)" % (instance.__class__.__name__, instance._name), instance.stop) for instance in started]
+        if self.__profiling:
+            steps.append(("profiler", self.stop_profiling))
+        self._run_steps(steps, deadline)
+        if self.event_bus is not None:
+            self._run_steps([("event bus", self.event_bus.stop)], deadline)
+        if self.dispatcher is not None and self.__owns_dispatcher:
+            self._run_steps([("dispatcher", lambda: self.dispatcher.stop(
+                timeout=max(deadline - time.time(), 0.)))], deadline)
+        for t in self.__start_threads:
+            t.join(max(deadline - time.time(), 0.))
+        self._run_steps([("broker", self.supervisor.shutdown)], deadline)
+
+    def __startup_finished(self):
+        return all(v["state"] in ("started", "ready", "failed") for v in self.__readiness.values())
+
+    def readiness(self):
+        """
+        :return: A dictionary mapping the names of the events to a dictionary with their class name, their state
+        ("pending", "initialising", "starting", "started", "ready" if not started automatically, or "failed"),
+        the exception if the start failed, and the time of the last change of state.
+        """
+        with self.__readiness_cond:
+            return dict((k, dict(v)) for k, v in self.__readiness.items())
+
+    def is_ready(self):
+        """
+        :return: True if all events have been initialised (and started if auto_start is used)
+        """
+        with self.__readiness_cond:
+            return all(v["state"] in ("started", "ready") for v in self.__readiness.values())
+
+    def _on_reconnect(self):
+        """
+        Restores all modules, proxies, and subscriptions after the supervisor rebuilt the broker.
+        """
+        instances = ([self.event_bus] if self.event_bus is not None else []) + \
+            [e[0] if isinstance(e, (tuple, list)) else e for e in self.events]
+        for instance in instances:
+            try:
+                instance.reconnect()
+            except RuntimeError as e:
+                print "Failed to restore '%s': %s" % (instance.__class__.__name__, e)
+        print "Restored %d modules after reconnect." % len(instances)
+
+    def _on_event(self, event, args):
+        """
+        Observer for all payloads received by the events of this manager. Called on the NAOqi callback thread.
+        """
+        self.scheduler.trigger(event)
+        history = self.__histories.get(event)
+        if history is not None:
+            history.append(args[1])
+        for observer in self.__observers:
+            try:
+                observer(event, args)
+            except Exception:
+                print "Exception in observer for '%s':" % str(event)
+                traceback.print_exc()
+
+    def add_observer(self, observer):
+        """
+        Registers a function that is called with the event name and the list of arguments for every payload received by
+        the events of this manager, before the callbacks are executed. Observers run on the NAOqi callback thread and
+        should be fast.
+
+        :param observer: The function `observer(event_name, args)`
+        """
+        self.__observers.append(observer)
+
+    def remove_observer(self, observer):
+        """
+        :param observer: A function registered via `add_observer`
+        """
+        self.__observers.remove(observer)
+
+    def inject(self, event, value):
+        """
+        Delivers a payload to all events of this manager subscribed to the given event as if it came from NAOqi.
+
+        :param event: The name of the event
+        :param value: The payload of the event
+        """
+        args = (event, value, "")
+        if self.event_bus is not None:
+            self.event_bus.on_event(*args)
+            return
+        for e in self.events:
+            instance = e[0] if isinstance(e, (tuple, list)) else e
+            if event in instance._subscriptions:
+                instance.on_event(*args)
+
+    def keep_history(self, event, size=100, max_age=None):
+        """
+        Keeps the latest values of an event received by the events of this manager, so tasks can read them via
+        `latest`, `window`, and `since` instead of reading ALMemory. The values are stored as received from NAOqi.
+
+        :param event: The name of the event
+        :param size: The maximum number of values kept
+        :param max_age: Optional argument. The maximum age in seconds of the values returned by the queries.
+        :return: The naoqi_interfaces.events.history.EventHistory
+        """
+        history = self.__histories[event] = EventHistory(size, max_age)
+        return history
+
+    def history(self, event):
+        """
+        :param event: The name of the event
+        :return: The EventHistory kept via `keep_history` or, if there is none, the one of the first event class that
+        keeps a history of the event
+        :raises KeyError: If no history is kept for the event
+        """
+        history = self.__histories.get(event)
+        if history is not None:
+            return history
+        for e in self.events:
+            instance = e[0] if isinstance(e, (tuple, list)) else e
+            if event in instance._histories:
+                return instance._histories[event]
+        raise KeyError("No history is kept for '%s'. Use keep_history." % event)
+
+    def latest(self, event):
+        """
+        :param event: The name of the event
+        :return: The latest tuple (timestamp, value) of the event or None if it has not been received, yet
+        """
+        return self.history(event).latest()
+
+    def window(self, event, seconds):
+        """
+        :param event: The name of the event
+        :param seconds: The length of the window
+        :return: A list of all tuples (timestamp, value) of the event received in the last `seconds`, oldest first
+        """
+        return self.history(event).window(seconds)
+
+    def since(self, event, timestamp):
+        """
+        :param event: The name of the event
+        :param timestamp: The time in seconds since the epoch
+        :return: A list of all tuples (timestamp, value) of the event received at or after the given time, oldest first
+        """
+        return self.history(event).since(timestamp)
+
+    def start_recording(self, path, events=None):
+        """
+        Writes all events received by this manager into a binary log that can be replayed with `replay`. Recording
+        stops on shutdown or when `stop_recording` is called.
+
+        :param path: The file to write to. If it exists, new events are appended.
+        :param events: Optional argument. A list of event names to record. If omitted, all events are recorded.
+        :return: The EventRecorder
+        """
+        self.stop_recording()
+        self.recorder = EventRecorder(path, events)
+        self.add_observer(self.recorder)
+        return self.recorder
+
+    def stop_recording(self):
+        """
+        Stops recording and closes the log.
+        """
+        recorder, self.recorder = self.recorder, None
+        if recorder is not None:
+            self.remove_observer(recorder)
+            recorder.close()
+
+    def start_publishing(self, name, size=4 * 1024 * 1024, events=None):
+        """
+        Publishes all events received by this manager into a ring buffer in shared memory, so other processes on the
+        same machine can read them via naoqi_interfaces.control.fanout.Subscriber without connecting to the robot.
+        Publishing stops on shutdown or when `stop_publishing` is called.
+
+        :param name: The name of the buffer. Subscribers use the same name.
+        :param size: The size of the buffer in bytes. Larger events are dropped, see `Publisher.dropped`.
+        :param events: Optional argument. A list of event names to publish. If omitted, all events are published.
+        :return: The Publisher
+        """
+        self.stop_publishing()
+        self.publisher = Publisher(name, size=size, events=events)
+        self.add_observer(self.publisher)
+        return self.publisher
+
+    def stop_publishing(self):
+        """
+        Stops publishing and removes the buffer.
+        """
+        publisher, self.publisher = self.publisher, None
+        if publisher is not None:
+            self.remove_observer(publisher)
+            publisher.close()
+
+    def start_profiling(self, interval=.005):
+        """
+        Starts the sampling profiler. While it runs, the stacks of all threads executing an event callback or a task
+        are sampled every `interval` seconds and attributed to the event or task, see `profile` and `write_profile`.
+        Like the statistics, the profiler covers the whole process. Profiling stops on shutdown or when
+        `stop_profiling` is called.
 
-    def spin(self, *args):
+        :param interval: The time in seconds between two samples
+        :return: The naoqi_interfaces.control.profiler.SamplingProfiler
         """
-        Blocking until Ctrl+C is received. Executes given functions in sequence. Functions cannot have arguments.
-        :param args: Functions to be executed each iteration.
+        profiling.profiler.interval = interval
+        profiling.profiler.start()
+        self.__profiling = True
+        return profiling.profiler
+
+    def stop_profiling(self):
+        """
+        Stops the sampling profiler. The samples are kept until `reset_profile` is called.
+        """
+        self.__profiling = False
+        profiling.profiler.stop(timeout=1.)
+
+    def reset_profile(self):
+        """
+        Removes all samples taken so far.
+        """
+        profiling.profiler.reset()
+
+    def profile(self, top=5):
+        """
+        :param top: The number of hottest lines to return per event or task
+        :return: A dictionary mapping "event:<name>" and "task:<name>" to the number of samples, the estimated time in
+        seconds, and the hottest lines. See naoqi_interfaces.control.profiler.SamplingProfiler.summary.
+        """
+        return profiling.profiler.summary(top)
+
+    def write_profile(self, path):
+        """
+        Writes the samples as collapsed stacks, one line per stack, that can be turned into a flame graph, e.g. with
+        `flamegraph.pl path > profile.svg` or by loading the file into speedscope.
+
+        :param path: The file to write to
+        """
+        profiling.profiler.write_collapsed(path)
+
+    def replay(self, path, realtime=True, speed=1., events=None):
+        """
+        Feeds a log written by `start_recording` through the callbacks of the events of this manager. Blocking.
+
+        :param path: The file to read
+        :param realtime: If True, the original time between events is kept (divided by `speed`). If False, the events
+        are delivered as fast as possible.
+        :param speed: Factor by which the replay is faster than the recording if `realtime` is True
+        :param events: Optional argument. A list of event names to replay. If omitted, all events are replayed.
+        :return: The number of events delivered
+        """
+        return replay(path, self.inject, realtime=realtime, speed=speed, events=events,
+                      is_shutdown=lambda: self.__shutdown_requested)
+
+    def add_task(self, func, period=None, trigger=None):
+        """
+        Registers a function to be executed by `spin`, either periodically, whenever an event fires, or both. Tasks are
+        executed one after the other on the thread calling `spin`.
+
+        :param func: The function to execute. Cannot have arguments.
+        :param period: Optional argument. The time in seconds between two executions.
+        :param trigger: Optional argument. The name of an event (or a list of names) that triggers an execution.
+        :return: The Task object. Can be given to `remove_task`.
+        """
+        return self.scheduler.add_task(func, period=period, trigger=trigger)
+
+    def remove_task(self, task):
+        """
+        Stops executing a task added via `add_task` or `spin`.
+
+        :param task: The Task object returned by `add_task`
+        """
+        self.scheduler.remove_task(task)
+
+    def add_key_group(self, keys, period, handler, threshold=0., default=None):
+        """
+        Periodically reads memory keys that are not published as events, e.g. joint temperatures or the battery charge.
+        All keys of the group are read with a single call and groups that are due at the same time share a call. The
+        handler is only called if a value changed. Handlers are executed on the thread of the sampler.
+
+        :param keys: The list of memory keys, e.g. built with naoqi_interfaces.comms.memory_accessor.person_keys
+        :param period: The time in seconds between two reads
+        :param handler: The function `handler(values)` called with a dictionary mapping the keys to their values
+        :param threshold: Numbers, and lists of numbers element-wise, only count as changed if they differ by more than
+        this from the values last handed to the handler
+        :param default: The value used for keys that do not exist
+        :return: The KeyGroup. Can be given to `remove_key_group`.
+        """
+        group = self.sampler.add_group(keys, period, handler, threshold=threshold, default=default)
+        if not self.__shutdown_requested:
+            self.sampler.start()
+        return group
+
+    def remove_key_group(self, group):
+        """
+        Stops reading a group of keys added via `add_key_group`.
+
+        :param group: The KeyGroup returned by `add_key_group`
+        """
+        self.sampler.remove_group(group)
+
+    def spin(self, *args, **kwargs):
+        """
+        Blocking until Ctrl+C is received. Executes the given functions and all tasks added via `add_task`. The thread
+        sleeps until the next task is due instead of polling. Functions cannot have arguments.
+        :param args: Functions to be executed periodically.
+        :param period: Keyword argument. The time in seconds between two executions of the functions in args. Default
+        is .01 seconds.
         :return:
         """
-        while not self.__shutdown_requested:
-            for f in args:
-                f()
-            time.sleep(.01)
+        period = kwargs.pop("period", .01)
+        if kwargs:
+            raise TypeError("spin() got unexpected keyword arguments: %s" % ", ".join(kwargs))
+        for f in args:
+            self.add_task(f, period=period)
+        if not self.__shutdown_requested:
+            self.scheduler.run()
+        # Ctrl+C hands the shutdown to a thread. Returning before it finished would end the script too early. Waiting
+        # with a timeout keeps the main thread responsive to a second Ctrl+C.
+        while self.__shutdown_requested and not self.__shutdown_done.wait(.1):
+            pass
+
+    def stats(self, process_wide=True):
+        """
+        Statistics are only recorded for events, callbacks, and proxies if `collect_stats` is True. They are collected
+        for the whole process, i.e. they include ServiceProxy calls made outside of the events of this manager.
+
+        :param process_wide: If False, the statistics collected for the whole process, i.e. "events", "callbacks",
+        "proxies", and "profile", and the "queues" of a dispatcher shared with other managers are left out.
+
+        :return: A dictionary with the statistics of all tasks (see naoqi_interfaces.control.scheduler.Task.stats), the
+        queues of the dispatcher if one is used, the memory sampler if key groups are used, and the count, rate, and
+        latencies of all "events", "callbacks", and "proxies" methods called via ServiceProxy (see
+        naoqi_interfaces.control.stats.LatencyStats.snapshot). If the profiler took samples, the "profile" (see
+        `profile`).
+        """
+        result = stats.collector.snapshot() if process_wide else {}
+        result["tasks"] = self.scheduler.stats()
+        if self.sampler.groups:
+            result["sampler"] = self.sampler.stats()
+        if self.dispatcher is not None and (process_wide or self.__owns_dispatcher):
+            result["queues"] = self.dispatcher.queue_stats()
+        if process_wide and profiling.profiler.samples:
+            result["profile"] = self.profile()
+        return result
+
+    def dump_stats(self, period, func=None):
+        """
+        Periodically hands the statistics to the given function while `spin` is running. Enables the collection of
+        statistics if it was not enabled in the constructor.
+
+        :param period: The time in seconds between two dumps
+        :param func: Optional argument. A function taking the dictionary returned by `stats`. If omitted, the
+        statistics are printed as a table.
+        :return: The Task object. Can be given to `remove_task` to stop dumping.
+        """
+        stats.collector.enabled = True
+        func = stats.print_stats if func is None else func
+
+        def dump():
+            func(self.stats())
+        return self.add_task(dump, period=period)
+
+    def service(self, proxy_name):
+        """
+        :param proxy_name: The name of the proxy, e.g. ALAnimatedSpeech
+        :return: A ServiceProxy talking to the robot of this manager
+        """
+        return ServiceProxy(proxy_name, self.registry)
 
     def _signal_handler(self, *args):
+        # The signal handler interrupts the main thread wherever it is, possibly while it holds a lock the shutdown
+        # needs. Hence, the shutdown runs on its own thread and `spin` waits for it.
+        if self.__shutdown_requested:
+            print "Already stopping, please wait."
+            return
         print "Caught Ctrl+C, stopping."
         self.__shutdown_requested = True
+        threading.Thread(target=self.shutdown, name="shutdown").start()
+
+    @staticmethod
+    def _run_steps(steps, deadline):
+        """
+        Runs the given steps concurrently, one thread each, and waits for them until the deadline.
+
+        :param steps: A list of tuples (name, function without arguments)
+        :param deadline: The time in seconds since the epoch after which unfinished steps are abandoned
+        :return: A tuple of the lists of the names of the steps that timed out and that failed
+        """
+        failed = []
+
+        def run(name, func):
+            try:
+                func()
+            except Exception:
+                print "Exception in shutdown step '%s':" % name
+                traceback.print_exc()
+                failed.append(name)
+
+        threads = [(name, threading.Thread(target=run, args=(name, func), name="shutdown-%s" % name))
+                   for name, func in steps]
+        for _, t in threads:
+            t.daemon = True
+            t.start()
+        for _, t in threads:
+            t.join(max(deadline - time.time(), 0.))
+        return [name for name, t in threads if t.is_alive()], failed
+
+    def shutdown(self, timeout=None):
+        """
+        Stops all events, tasks, and the connection to the robot and executes the shutdown functions. Called on Ctrl+C.
+        The events are unsubscribed concurrently and the whole shutdown is bounded by a deadline: steps that do not
+        finish in time, e.g. because the robot cannot be reached, are abandoned and reported. Safe to call more than
+        once; later calls wait for the first one to finish.
+
+        :param timeout: Optional argument. The maximum time in seconds for the whole shutdown. If omitted,
+        `shutdown_timeout` is used.
+        :return: A dictionary with the names of the steps that "timed_out" and "failed" and the "duration" in seconds
+        """
+        timeout = self.shutdown_timeout if timeout is None else timeout
+        with self.__shutdown_lock:
+            first, self.__shutting_down = not self.__shutting_down, True
+        if not first:
+            self.__shutdown_done.wait(timeout)
+            return self.__shutdown_report
+        self.__shutdown_requested = True
+        start = time.time()
+        deadline = start + timeout
+        report = {"timed_out": [], "failed": []}
+
+        def run(*steps):
+            timed_out, failed = self._run_steps(steps, deadline)
+            report["timed_out"].extend(timed_out)
+            report["failed"].extend(failed)
+
+        run(("supervisor", lambda: self.supervisor.stop(timeout=max(deadline - time.time(), 0.))),
+            ("scheduler", self.scheduler.stop),
+            ("sampler", lambda: self.sampler.stop(timeout=max(deadline - time.time(), 0.))),
+            # The profiler covers the whole process, so only stop it if this manager started it
+            ("profiler", lambda: self.__profiling and self.stop_profiling()),
+            ("recorder", self.stop_recording),
+            ("publisher", self.stop_publishing))
         print "Executing shutdown functions."
-        for event in self.events:
-            event[0].stop() if isinstance(event, (tuple, list)) else event.stop()
-        for f in self.__on_shutdown: f()
+        instances = [event[0] if isinstance(event, (tuple, list)) else event for event in self.events]
+        run(*[("%s (%s)" % (instance.__class__.__name__, instance._name), instance.stop) for instance in instances])
+        if self.event_bus is not None:
+            run(("event bus", self.event_bus.stop))
+        if self.dispatcher is not None and self.__owns_dispatcher:
+            run(("dispatcher", lambda: self.dispatcher.stop(timeout=max(deadline - time.time(), 0.))))
+
+        def on_shutdown():
+            for f in self.__on_shutdown: f()
+        run(("shutdown functions", on_shutdown))
         print "Killing broker"
-        con.shutdown_broker(self.broker)
+        run(("broker", self.supervisor.shutdown))
+        report["duration"] = time.time() - start
+        if report["timed_out"]:
+            print "Warning: Shutdown steps timed out after %.1f seconds: %s" % (
+                timeout, ", ".join(report["timed_out"]))
+        self.__shutdown_report = report
+        self.__shutdown_done.set()
         print "Good-bye"
+        return report
 
     def on_shutdown(self, *args):
         """
@@ -0,0 +1,306 @@
+"""
+Hands the events received by one process to other processes on the same machine via a ring buffer in shared memory.
+The gateway process owns the connection to the robot and the subscriptions:
+
+    man = EventManager(globals_=globals(), ip=..., port=..., events=[...])
+    man.start_publishing("people")
+    man.spin()
+
+Worker processes read from the buffer without connecting to the robot:
+
+    subscriber = Subscriber("people", events=["PeoplePerception/PeopleDetected"])
+    subscriber.run(handle)  # handle(event, value), blocking
+
+There is one writer and any number of readers. Every reader has its own position. A reader that falls behind by more
+than the size of the buffer loses the overwritten events, which is counted in `dropped`.
+"""
+import cPickle as pickle
+import mmap
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+
+MAGIC = "NQISHMRB"
+VERSION = 1
+
+# Header: magic, version, size of the data area, position of the next record, position of the oldest record,
+# sequence number of the next record, generation. Positions count all bytes ever written, the offset in the data area
+# is the position modulo the size.
+_HEADER = struct.Struct("<8sH6xQQQQQ")
+_HEADER_SIZE = 64
+_HEAD = struct.Struct("<Q")
+_LENGTH = struct.Struct("<I")
+_HEAD_OFFSET = 24
+_TAIL_OFFSET = 32
+_SEQ_OFFSET = 40
+# Record: length of the whole record, sequence number, timestamp, length of the event name. Followed by the name and
+# the pickled payload.
+_RECORD = struct.Struct("<IQdH")
+# Written instead of a record if the rest of the data area is too small. The next record starts at offset 0.
+_WRAP = 0xffffffff
+_ALIGN = 8
+
+
+def default_path(name):
+    """
+    :param name: The name of the buffer
+    :return: The path of the file backing the buffer. In /dev/shm if available so it never touches the disk.
+    """
+    directory = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(directory, "naoqi_interfaces_%s" % name)
+
+
+def _path(name_or_path):
+    return name_or_path if os.sep in name_or_path else default_path(name_or_path)
+
+
+class Publisher(object):
+    """
+    Writes events into the shared ring buffer. Can be used as an observer for the EventManager, see
+    `EventManager.start_publishing`. An existing buffer of the same name is replaced.
+
+    :param name: The name of the buffer or the path of the file backing it
+    :param size: The size of the buffer in bytes. Larger events are dropped with a warning and counted in `dropped`.
+    :param events: Optional argument. A list of event names to publish. If omitted, all events are published.
+    """
+    def __init__(self, name, size=4 * 1024 * 1024, events=None):
+        self.path = _path(name)
+        self.size = size - size % _ALIGN
+        self.events = None if events is None else set(events)
+        self.count = 0
+        self.dropped = 0
+        self.__lock = threading.Lock()
+        # Subscribers of a previous publisher still map the old file. Truncating it would crash them with SIGBUS, so
+        # the new buffer is created under a temporary name and replaces the old file atomically. Subscribers keep the
+        # old inode until they notice the new generation.
+        fd, tmp_path = tempfile.mkstemp(prefix=".%s." % os.path.basename(self.path), dir=os.path.dirname(self.path))
+        os.chmod(tmp_path, 0644)
+        self.__file = os.fdopen(fd, "w+b")
+        self.__file.truncate(_HEADER_SIZE + self.size)
+        self.__buf = mmap.mmap(self.__file.fileno(), _HEADER_SIZE + self.size)
+        self.__head = self.__tail = 0
+        self.__seq = 0
+        _HEADER.pack_into(self.__buf, 0, MAGIC, VERSION, self.size, 0, 0, 0, random.getrandbits(63))
+        os.rename(tmp_path, self.path)
+        self.__inode = os.fstat(fd).st_ino
+
+    def __call__(self, event, args):
+        self.publish(event, args[1])
+
+    def publish(self, event, value, timestamp=None):
+        """
+        :param event: The name of the event
+        :param value: The payload of the event. Has to be picklable.
+        :param timestamp: Optional argument. The time the event was received. If omitted, the current time is used.
+        """
+        if self.events is not None and event not in self.events:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        name = event.encode("utf-8") if isinstance(event, unicode) else event
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        length = _RECORD.size + len(name) + len(payload)
+        length += -length % _ALIGN
+        if length > self.size:
+            # Raising here would abort the delivery to the observers after the publisher
+            self.dropped += 1
+            print "Warning: Dropping event '%s' of %d bytes, it does not fit into the buffer of %d bytes." % (
+                event, length, self.size)
+            return
+        with self.__lock:
+            if self.__buf is None:
+                return
+            start = self.__head
+            offset = start % self.size
+            if offset + length > self.size:
+                # Not enough space before the end of the data area
+                start += self.size - offset
+                offset = 0
+            self._free(start + length)
+            if start != self.__head:
+                _LENGTH.pack_into(self.__buf, _HEADER_SIZE + self.__head % self.size, _WRAP)
+            base = _HEADER_SIZE + offset
+            _RECORD.pack_into(self.__buf, base, length, self.__seq, timestamp, len(name))
+            base += _RECORD.size
+            self.__buf[base:base + len(name)] = name
+            base += len(name)
+            self.__buf[base:base + len(payload)] = payload
+            self.__seq += 1
+            self.__head = start + length
+            # Only make the record visible once it is complete
+            _HEAD.pack_into(self.__buf, _SEQ_OFFSET, self.__seq)
+            _HEAD.pack_into(self.__buf, _HEAD_OFFSET, self.__head)
+            self.count += 1
+
+    def _free(self, end):
+        """
+        Moves the position of the oldest record forward until writing up to `end` does not overwrite any record that is
+        still readable. Has to be called with the lock held.
+        """
+        tail = self.__tail
+        while end - tail > self.size:
+            length, = _LENGTH.unpack_from(self.__buf, _HEADER_SIZE + tail % self.size)
+            tail += self.size - tail % self.size if length == _WRAP else length
+        if tail != self.__tail:
+            self.__tail = tail
+            # Readers check the tail after copying a record to find out whether it was overwritten meanwhile
+            _HEAD.pack_into(self.__buf, _TAIL_OFFSET, tail)
+
+    def close(self):
+        """
+        Stops publishing. The file is removed, readers that are still open keep their mapping.
+        """
+        with self.__lock:
+            if self.__buf is None:
+                return
+            self.__buf.close()
+            self.__buf = None
+            self.__file.close()
+            try:
+                # The file may already belong to a new publisher of the same name
+                if os.stat(self.path).st_ino == self.__inode:
+                    os.remove(self.path)
+            except OSError:
+                pass
+
+
+class Subscriber(object):
+    """
+    Reads events from a shared ring buffer written by a Publisher in another process.
+
+    :param name: The name of the buffer or the path of the file backing it
+    :param events: Optional argument. A list of event names to read. If omitted, all events are read.
+    :param from_start: If True, all events still in the buffer are read first. Otherwise only events published after
+    the subscriber was created are read.
+    """
+    def __init__(self, name, events=None, from_start=False):
+        self.path = _path(name)
+        self.events = None if events is None else set(events)
+        self.dropped = 0
+        self.received = 0
+        self.check_interval = 1.
+        self.__last_check = time.time()
+        self.__buf = None
+        self.__generation = None
+        self.__from_start = from_start
+        self._open()
+
+    def _open(self):
+        with open(self.path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, size, head, tail, seq, generation = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            buf.close()
+            raise IOError("'%s' is not an event buffer" % self.path)
+        if version != VERSION:
+            buf.close()
+            raise IOError("Unsupported event buffer version %d" % version)
+        if self.__buf is not None:
+            self.__buf.close()
+        self.__buf = buf
+        self.size = size
+        self.__generation = generation
+        if self.__from_start:
+            self.__cursor = tail
+            self.__next_seq = None
+        else:
+            self.__cursor = head
+            self.__next_seq = seq
+
+    def _check_generation(self):
+        # Returns True if a new publisher replaced the buffer and it was opened
+        try:
+            with open(self.path, "rb") as f:
+                generation = _HEADER.unpack(f.read(_HEADER.size))[6]
+        except (IOError, struct.error):
+            return False
+        if generation == self.__generation:
+            return False
+        self.__from_start = True
+        self._open()
+        return True
+
+    def poll(self, max_events=None):
+        """
+        Reads all events published since the last call without blocking.
+
+        :param max_events: Optional argument. The maximum number of events to return.
+        :return: A list of tuples (timestamp, event name, payload)
+        """
+        result = []
+        buf = self.__buf
+        head, = _HEAD.unpack_from(buf, _HEAD_OFFSET)
+        if head <= self.__cursor:
+            if time.time() - self.__last_check > self.check_interval:
+                self.__last_check = time.time()
+                if self._check_generation():
+                    return self.poll(max_events)
+            return result
+        while self.__cursor < head and (max_events is None or len(result) < max_events):
+            tail, = _HEAD.unpack_from(buf, _TAIL_OFFSET)
+            if self.__cursor < tail:
+                self.__cursor = tail
+                continue
+            offset = _HEADER_SIZE + self.__cursor % self.size
+            length, = _LENGTH.unpack_from(buf, offset)
+            if length != _WRAP and offset + _RECORD.size <= len(buf):
+                length, seq, timestamp, name_length = _RECORD.unpack_from(buf, offset)
+                data = buf[offset + _RECORD.size:offset + length]
+            else:
+                data = None
+            # The record was overwritten while it was copied
+            tail, = _HEAD.unpack_from(buf, _TAIL_OFFSET)
+            if self.__cursor < tail:
+                continue
+            if length != _WRAP and data is None:
+                raise IOError("Corrupt event buffer '%s' at byte %d" % (self.path, offset))
+            if data is None:
+                self.__cursor += self.size - self.__cursor % self.size
+                continue
+            self.__cursor += length
+            if self.__next_seq is not None and seq > self.__next_seq:
+                self.dropped += seq - self.__next_seq
+            self.__next_seq = seq + 1
+            event = data[:name_length]
+            if self.events is not None and event not in self.events:
+                continue
+            result.append((timestamp, event, pickle.loads(data[name_length:])))
+        self.received += len(result)
+        return result
+
+    def read(self, timeout=None, poll_interval=.001):
+        """
+        Blocks until at least one event is available.
+
+        :param timeout: Optional argument. The maximum time to wait in seconds.
+        :param poll_interval: The time in seconds between two checks of the buffer
+        :return: A list of tuples (timestamp, event name, payload). Empty if the timeout passed.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        while True:
+            events = self.poll()
+            if events or (deadline is not None and time.time() >= deadline):
+                return events
+            time.sleep(poll_interval)
+
+    def run(self, handler, poll_interval=.001, is_shutdown=None):
+        """
+        Calls the handler for every event until `is_shutdown` returns True or Ctrl+C is received.
+
+        :param handler: The function `handler(event, value)`
+        :param poll_interval: The time in seconds between two checks of the buffer
+        :param is_shutdown: Optional function without arguments. Reading stops when it returns True.
+        """
+        try:
+            while is_shutdown is None or not is_shutdown():
+                for _, event, value in self.read(timeout=.1, poll_interval=poll_interval):
+                    handler(event, value)
+        except KeyboardInterrupt:
+            pass
+
+    def close(self):
+        if self.__buf is not None:
+            self.__buf.close()
+            self.__buf = None
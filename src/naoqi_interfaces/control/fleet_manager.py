@@ -0,0 +1,302 @@
+from naoqi_interfaces.comms.proxy_registry import ProxyRegistry
+from naoqi_interfaces.control.dispatcher import Dispatcher
+from naoqi_interfaces.control.event_manager import EventManager
+from naoqi_interfaces.services.service_proxy import ServiceProxy
+import naoqi_interfaces.control.profiler as profiling
+import naoqi_interfaces.control.stats as stats
+import signal
+import threading
+import time
+import traceback
+
+
+class FleetManager(object):
+    """
+    Connects one process to many robots. Every robot gets its own EventManager with its own broker, proxies, and
+    events, while the worker threads executing the callbacks are shared by all robots. Robots are started and stopped
+    concurrently, so a robot that cannot be reached does not hold up the others:
+
+    def create_events(robot):
+        return [PeopleEvent(), SpeechEvent()]
+
+    fleet = FleetManager(globals(), {"pepper1": ("10.0.0.11", 9559), "pepper2": ("10.0.0.12", 9559)}, create_events)
+    fleet.start()
+    fleet.service("pepper1", "ALTextToSpeech").say("Hello")
+    fleet.spin()
+
+    :param globals_: The global variables of the main file, i.e. globals()
+    :param robots: Optional argument. A dictionary mapping the names of the robots to tuples (ip, port)
+    :param events: Optional argument. A function `events(robot_name)` returning the list of events for a robot, as
+    accepted by the EventManager. Every robot needs its own instances.
+    :param workers: The number of worker threads shared by the callbacks of all robots. 0 executes the callbacks on the
+    NAOqi callback threads.
+    :param dispatcher: Optional argument. A Dispatcher to use instead of creating one with `workers` threads.
+    :param start_timeout: The time in seconds a robot may take to connect and start its events. Robots that take longer
+    are listed in `failed`. Also used as `connect_timeout` of the EventManagers unless given in `manager_args`.
+    :param manager_args: Keyword arguments handed to every EventManager, e.g. `auto_reconnect` or `startup_timeout`
+    """
+    def __init__(self, globals_, robots=None, events=None, workers=4, dispatcher=None, start_timeout=30.,
+                 **manager_args):
+        self.globals_ = globals_
+        self.events = events
+        self.start_timeout = start_timeout
+        manager_args.setdefault("connect_timeout", start_timeout)
+        self.manager_args = manager_args
+        if dispatcher is None and workers:
+            dispatcher = Dispatcher(workers=workers)
+        self.dispatcher = dispatcher
+        self.failed = {}
+        self.__robots = {}
+        self.__managers = {}
+        self.__spinners = {}
+        self.__abandoned = set()
+        self.__observers = []
+        self.__on_shutdown = []
+        self.__lock = threading.Lock()
+        self.__stopping = False
+        self.__stopped = threading.Event()
+        for name, address in (robots or {}).items():
+            self.add_robot(name, *address)
+
+    def add_robot(self, name, ip, port, events=None):
+        """
+        Adds a robot. Call `start` to connect to it.
+
+        :param name: The name of the robot, used to address it in this manager
+        :param ip: The IP of the robot
+        :param port: The port of the robot
+        :param events: Optional argument. A function `events(robot_name)` returning the list of events for this robot.
+        If omitted, the function given in the constructor is used.
+        """
+        with self.__lock:
+            if name in self.__robots:
+                raise KeyError("Robot '%s' already exists." % name)
+            self.__robots[name] = (ip, port, events)
+
+    def robots(self):
+        """
+        :return: The names of all robots
+        """
+        with self.__lock:
+            return sorted(self.__robots)
+
+    def __getitem__(self, name):
+        return self.manager(name)
+
+    def manager(self, name):
+        """
+        :param name: The name of the robot
+        :return: The EventManager of the robot
+        :raises KeyError: If the robot has not been started
+        """
+        with self.__lock:
+            try:
+                return self.__managers[name]
+            except KeyError:
+                raise KeyError("Robot '%s' is not running." % name)
+
+    def service(self, name, proxy_name):
+        """
+        :param name: The name of the robot
+        :param proxy_name: The name of the proxy, e.g. ALAnimatedSpeech
+        :return: A ServiceProxy talking to the given robot
+        """
+        return ServiceProxy(proxy_name, self.manager(name).registry)
+
+    def add_observer(self, observer):
+        """
+        Registers a function that is called for every payload received from any robot, see
+        `EventManager.add_observer`. Applies to robots started afterwards as well.
+
+        :param observer: The function `observer(robot_name, event_name, args)`
+        """
+        with self.__lock:
+            self.__observers.append(observer)
+            managers = self.__managers.items()
+        for name, manager in managers:
+            manager.add_observer(self._observer(name, observer))
+
+    @staticmethod
+    def _observer(name, observer):
+        def observe(event, args):
+            observer(name, event, args)
+        return observe
+
+    def _start_robot(self, name):
+        ip, port, events = self.__robots[name]
+        events = self.events if events is None else events
+        manager = EventManager(
+            self.globals_, ip, port, events=None if events is None else events(name), dispatcher=self.dispatcher,
+            registry=ProxyRegistry(ip=ip, port=port), install_signal_handler=False, **self.manager_args)
+        with self.__lock:
+            abandoned = name in self.__abandoned
+            if not abandoned:
+                self.__managers[name] = manager
+            observers = list(self.__observers)
+        if abandoned:
+            # `start` already reported the robot as failed
+            manager.shutdown()
+            return manager
+        for observer in observers:
+            manager.add_observer(self._observer(name, observer))
+        return manager
+
+    def start(self, names=None):
+        """
+        Connects to the robots and starts their events concurrently. Robots that fail to start are reported and listed
+        in `failed`, the others keep running.
+
+        :param names: Optional argument. The names of the robots to start. If omitted, all robots that are not running
+        are started.
+        :return: A dictionary mapping the names of the robots that failed to start to the exception
+        """
+        if self.dispatcher is not None:
+            self.dispatcher.start()
+        with self.__lock:
+            names = [n for n in (self.__robots if names is None else names) if n not in self.__managers]
+            self.__abandoned.difference_update(names)
+        failed = self._run(self._start_robot, names, self.start_timeout)
+        with self.__lock:
+            for name in failed.keys():
+                if name in self.__managers:
+                    # Finished right after the timeout
+                    del failed[name]
+                else:
+                    self.__abandoned.add(name)
+        for name, error in failed.items():
+            print "Failed to start robot '%s': %s" % (name, error)
+        self.failed.update(failed)
+        for name in names:
+            if name not in failed:
+                self.failed.pop(name, None)
+        return failed
+
+    def stop_robot(self, name):
+        """
+        Shuts down the EventManager of a robot. The robot can be started again with `start`.
+
+        :param name: The name of the robot
+        """
+        with self.__lock:
+            manager = self.__managers.pop(name, None)
+            spinner = self.__spinners.pop(name, None)
+        if manager is not None:
+            manager.shutdown()
+        if spinner is not None:
+            spinner.join(1.)
+
+    def remove_robot(self, name):
+        """
+        Shuts down a robot and removes it from this manager.
+
+        :param name: The name of the robot
+        """
+        self.stop_robot(name)
+        with self.__lock:
+            self.__robots.pop(name, None)
+        self.failed.pop(name, None)
+
+    @staticmethod
+    def _run(func, names, timeout=None):
+        """
+        Calls the function for all given robot names concurrently.
+
+        :param timeout: Optional argument. The time in seconds to wait for the calls to finish
+        :return: A dictionary mapping the names for which the function raised an exception or did not finish in time
+        to the exception
+        """
+        errors = {}
+
+        def run(name):
+            try:
+                func(name)
+            except Exception as e:
+                traceback.print_exc()
+                errors[name] = e
+
+        threads = [threading.Thread(target=run, args=(name,), name="fleet-%s" % name) for name in names]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        deadline = None if timeout is None else time.time() + timeout
+        for t in threads:
+            t.join(None if deadline is None else max(deadline - time.time(), 0.))
+        # Calls that finish later must not change the result
+        errors = dict(errors)
+        for name, t in zip(names, threads):
+            if t.is_alive():
+                errors[name] = RuntimeError("Robot '%s' did not finish within %.1f seconds." % (name, timeout))
+        return errors
+
+    def spin(self):
+        """
+        Blocking until Ctrl+C is received or `stop` is called. Executes the tasks of all robots, each on its own
+        thread. Installs the handler for Ctrl+C if called on the main thread.
+        """
+        if isinstance(threading.current_thread(), threading._MainThread):
+            signal.signal(signal.SIGINT, self._signal_handler)
+        with self.__lock:
+            for name, manager in self.__managers.items():
+                if name not in self.__spinners:
+                    spinner = threading.Thread(target=manager.spin, name="fleet-spin-%s" % name)
+                    spinner.daemon = True
+                    spinner.start()
+                    self.__spinners[name] = spinner
+        # Waiting with a timeout keeps the main thread responsive to Ctrl+C
+        while not self.__stopped.wait(1.):
+            pass
+
+    def _signal_handler(self, *args):
+        # Like the EventManager, the shutdown runs on its own thread instead of in the signal handler
+        if self.__stopping:
+            print "Already stopping, please wait."
+            return
+        print "Caught Ctrl+C, stopping fleet."
+        threading.Thread(target=self.stop, name="fleet-shutdown").start()
+
+    def stop(self):
+        """
+        Shuts down all robots concurrently, stops the shared worker threads, and executes the shutdown functions. Safe
+        to call more than once; later calls wait for the first one to finish.
+        """
+        with self.__lock:
+            first, self.__stopping = not self.__stopping, True
+            names = list(self.__managers)
+        if not first:
+            while not self.__stopped.wait(.1):
+                pass
+            return
+        self._run(self.stop_robot, names)
+        if self.dispatcher is not None:
+            self.dispatcher.stop(timeout=1.)
+        for f in self.__on_shutdown:
+            f()
+        self.__stopped.set()
+
+    def on_shutdown(self, *args):
+        """
+        Register functions without arguments that are executed after all robots have been shut down.
+
+        :param args: The function(s) to be called on shutdown.
+        """
+        self.__on_shutdown.extend(args)
+
+    def stats(self):
+        """
+        The statistics of the events, callbacks, and proxies are collected for the whole process and cannot be told
+        apart by robot, so they are only reported once for the fleet, like the queues of the shared dispatcher.
+
+        :return: A dictionary with the "events", "callbacks", and "proxies" of the whole process (see
+        naoqi_interfaces.control.stats.StatsCollector.snapshot), the "queues" of the shared dispatcher, the "profile" if
+        the profiler took samples, and the "robots", mapping the names of the running robots to their tasks and memory
+        samplers (see `EventManager.stats`)
+        """
+        with self.__lock:
+            managers = self.__managers.items()
+        result = stats.collector.snapshot()
+        if self.dispatcher is not None:
+            result["queues"] = self.dispatcher.queue_stats()
+        if profiling.profiler.samples:
+            result["profile"] = profiling.profiler.summary()
+        result["robots"] = dict((name, manager.stats(process_wide=False)) for name, manager in managers)
+        return result
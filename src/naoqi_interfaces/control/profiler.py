@@ -0,0 +1,162 @@
+"""
+A sampling profiler for event callbacks and the tasks of `EventManager.spin`. While enabled, a background thread
+periodically looks at the stacks of all threads that are currently executing a callback or task and counts where they
+are. The samples are attributed to the event or task, so a slow `callback_person` shows up under the event it handles
+instead of somewhere in the NAOqi or dispatcher threads:
+
+    man.start_profiling()
+    ...
+    man.stop_profiling()
+    man.write_profile("profile.folded")  # flamegraph.pl profile.folded > profile.svg
+
+The stacks are exported in the collapsed format used by flamegraph.pl, speedscope, and similar tools. Samples are taken
+by wall clock time, so a callback waiting for a proxy call is counted at the line making the call.
+"""
+import os
+import sys
+import thread
+import threading
+
+
+class SamplingProfiler(object):
+    """
+    Samples the stacks of the threads that are marked via `run`. Disabled by default. When disabled, the instrumented
+    code paths only check the `enabled` flag.
+
+    :param interval: The time in seconds between two samples
+    :param max_depth: The maximum number of frames kept per stack. Deeper frames are cut off at the leaf.
+    """
+    def __init__(self, interval=.005, max_depth=64):
+        self.enabled = False
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = 0
+        self.__marks = {}
+        self.__counts = {}
+        self.__lock = threading.Lock()
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def run(self, label, func, *args):
+        """
+        Calls the function and attributes all samples taken meanwhile on this thread to the given label.
+
+        :param label: The root of the sampled stacks, e.g. "event:PeoplePerception/PeopleDetected"
+        :param func: The function to call
+        :param args: The arguments of the function
+        :return: The return value of the function
+        """
+        ident = thread.get_ident()
+        previous = self.__marks.get(ident)
+        # Only the frames below this one belong to the callback
+        self.__marks[ident] = (label, sys._getframe())
+        try:
+            return func(*args)
+        finally:
+            if previous is None:
+                self.__marks.pop(ident, None)
+            else:
+                self.__marks[ident] = previous
+
+    def sample(self):
+        """
+        Takes one sample of all marked threads. Called periodically by the profiler thread.
+        """
+        frames = sys._current_frames()
+        stacks = []
+        for ident, (label, top) in self.__marks.items():
+            frame = frames.get(ident)
+            stack = []
+            while frame is not None and frame is not top:
+                code = frame.f_code
+                stack.append("%s (%s:%d)" % (code.co_name, os.path.basename(code.co_filename), frame.f_lineno))
+                frame = frame.f_back
+            del stack[:-self.max_depth]
+            stack.append(label)
+            stacks.append(";".join(reversed(stack)))
+        del frames
+        with self.__lock:
+            self.samples += 1
+            for stack in stacks:
+                self.__counts[stack] = self.__counts.get(stack, 0) + 1
+
+    def _loop(self):
+        while not self.__stop.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        """
+        Starts sampling in the background. Samples of earlier runs are kept, see `reset`.
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                return
+            self.__stop.clear()
+            self.__thread = threading.Thread(target=self._loop, name="profiler")
+            self.__thread.daemon = True
+            self.enabled = True
+            self.__thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stops sampling. The samples are kept.
+
+        :param timeout: Optional argument. Maximum time in seconds to wait for the profiler thread to finish.
+        """
+        with self.__lock:
+            self.enabled = False
+            self.__stop.set()
+            worker, self.__thread = self.__thread, None
+        if worker is not None and worker is not threading.current_thread():
+            worker.join(timeout)
+
+    def counts(self):
+        """
+        :return: A dictionary mapping the collapsed stacks, root first and separated by ";", to the number of samples
+        """
+        with self.__lock:
+            return dict(self.__counts)
+
+    def collapsed(self):
+        """
+        :return: The samples in the collapsed stack format, one line "label;frame;...;frame count" per stack, most
+        frequent first
+        """
+        return ["%s %d" % (s, c) for s, c in sorted(self.counts().items(), key=lambda x: (-x[1], x[0]))]
+
+    def write_collapsed(self, path):
+        """
+        :param path: The file to write the collapsed stacks to, e.g. for flamegraph.pl
+        """
+        with open(path, "w") as f:
+            for line in self.collapsed():
+                f.write(line + "\n")
+
+    def summary(self, top=5):
+        """
+        :param top: The number of hottest lines to return per label
+        :return: A dictionary mapping every label to its number of samples, the estimated time in seconds spent in it,
+        and its `top` hottest lines as tuples (frame, samples). Frames are the innermost frames of the stacks.
+        """
+        labels = {}
+        for stack, count in self.counts().items():
+            frames = stack.split(";")
+            entry = labels.setdefault(frames[0], {"samples": 0, "lines": {}})
+            entry["samples"] += count
+            entry["lines"][frames[-1]] = entry["lines"].get(frames[-1], 0) + count
+        return dict((label, {
+            "samples": entry["samples"],
+            "seconds": entry["samples"] * self.interval,
+            "top": sorted(entry["lines"].items(), key=lambda x: (-x[1], x[0]))[:top]
+        }) for label, entry in labels.items())
+
+    def reset(self):
+        """
+        Removes all samples.
+        """
+        with self.__lock:
+            self.samples = 0
+            self.__counts.clear()
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,212 @@
+import cPickle as pickle
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = "NQIEVLOG"
+VERSION = 1
+
+# Header: magic, version
+_HEADER = struct.Struct("<8sH")
+# Record type and name id, shared by both record types
+_PREFIX = struct.Struct("<BH")
+# Name record: length of the name. Followed by the name.
+_NAME = struct.Struct("<H")
+# Event record: timestamp, length of the payload. Followed by the pickled payload.
+_EVENT = struct.Struct("<dI")
+
+_NAME_RECORD = 0
+_EVENT_RECORD = 1
+
+
+class EventRecorder(object):
+    """
+    Writes events into an append-only binary log. Every event name is only written once and then referred to by a
+    numeric id, so a record only consists of 15 bytes of header and the pickled payload. Can be used as an observer
+    for the EventManager, see `EventManager.start_recording`.
+
+    :param path: The file to write to. If it exists, new events are appended.
+    :param events: Optional argument. A list of event names to record. If omitted, all events are recorded.
+    """
+    def __init__(self, path, events=None):
+        self.path = path
+        self.events = None if events is None else set(events)
+        self.count = 0
+        self.__lock = threading.Lock()
+        self.__names = {}
+        exists = os.path.exists(path) and os.path.getsize(path) >= _HEADER.size
+        if exists:
+            # Continue with the name ids already in the file and drop a partially written record at its end
+            self.__names, end = EventLog(path).scan()
+            with open(path, "r+b") as f:
+                f.truncate(end)
+        self.__file = open(path, "ab" if exists else "wb")
+        if not exists:
+            self.__file.write(_HEADER.pack(MAGIC, VERSION))
+
+    def __call__(self, event, args):
+        self.record(event, args[1])
+
+    def record(self, event, value, timestamp=None):
+        """
+        Appends an event to the log.
+
+        :param event: The name of the event
+        :param value: The payload of the event
+        :param timestamp: Optional argument. The time the event was received. If omitted, the current time is used.
+        """
+        if self.events is not None and event not in self.events:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        payload = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        with self.__lock:
+            if self.__file is None:
+                return
+            name_id = self.__names.get(event)
+            if name_id is None:
+                name_id = self.__names[event] = len(self.__names)
+                name = event.encode("utf-8") if isinstance(event, unicode) else event
+                self.__file.write(_PREFIX.pack(_NAME_RECORD, name_id) + _NAME.pack(len(name)) + name)
+            self.__file.write(_PREFIX.pack(_EVENT_RECORD, name_id) + _EVENT.pack(timestamp, len(payload)) + payload)
+            self.count += 1
+
+    def flush(self):
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.flush()
+
+    def close(self):
+        with self.__lock:
+            if self.__file is not None:
+                self.__file.close()
+                self.__file = None
+
+
+class EventLog(object):
+    """
+    Reads a log written by the EventRecorder. The file is memory mapped and only the payloads that are actually
+    accessed are unpickled.
+
+    :param path: The file to read
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def records(self):
+        """
+        Iterates over all events in the log. A record that was only written partially, e.g. because the programme was
+        killed, ends the iteration.
+
+        :return: A generator of tuples (timestamp, event name, payload)
+        """
+        for timestamp, event, data in self._raw_records():
+            yield timestamp, event, pickle.loads(data)
+
+    def __iter__(self):
+        return self.records()
+
+    def _raw_records(self):
+        for record in self._parse():
+            if record[0] == _EVENT_RECORD:
+                yield record[1:4]
+
+    def _parse(self):
+        """
+        :return: A generator of tuples (_NAME_RECORD, name id, name, end offset) and
+        (_EVENT_RECORD, timestamp, name, pickled payload, end offset) for all complete records.
+        """
+        names = {}
+        with open(self.path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                return
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                magic, version = _HEADER.unpack_from(buf, 0)
+                if magic != MAGIC:
+                    raise IOError("'%s' is not an event log" % self.path)
+                if version != VERSION:
+                    raise IOError("Unsupported event log version %d" % version)
+                offset, size = _HEADER.size, len(buf)
+                while offset + _PREFIX.size <= size:
+                    kind, name_id = _PREFIX.unpack_from(buf, offset)
+                    offset += _PREFIX.size
+                    if kind == _NAME_RECORD:
+                        if offset + _NAME.size > size:
+                            return
+                        length, = _NAME.unpack_from(buf, offset)
+                        offset += _NAME.size
+                        if offset + length > size:
+                            return
+                        names[name_id] = buf[offset:offset + length]
+                        offset += length
+                        yield _NAME_RECORD, name_id, names[name_id], offset
+                    elif kind == _EVENT_RECORD:
+                        if offset + _EVENT.size > size:
+                            return
+                        timestamp, length = _EVENT.unpack_from(buf, offset)
+                        offset += _EVENT.size
+                        if offset + length > size:
+                            return
+                        data = buf[offset:offset + length]
+                        offset += length
+                        yield _EVENT_RECORD, timestamp, names[name_id], data, offset
+                    else:
+                        raise IOError("Corrupt event log '%s' at byte %d" % (self.path, offset - _PREFIX.size))
+            finally:
+                buf.close()
+
+    def scan(self):
+        """
+        :return: A tuple of a dictionary mapping the event names to the numeric ids used in the log and the size of the
+        log in bytes without a partially written record at the end.
+        """
+        names, end = {}, _HEADER.size
+        for record in self._parse():
+            if record[0] == _NAME_RECORD:
+                names[record[2]] = record[1]
+            end = record[-1]
+        return names, end
+
+    def summary(self):
+        """
+        :return: A dictionary mapping event names to the number of recorded events
+        """
+        counts = {}
+        for _, event, _ in self._raw_records():
+            counts[event] = counts.get(event, 0) + 1
+        return counts
+
+
+def replay(path, sink, realtime=True, speed=1., events=None, is_shutdown=None):
+    """
+    Feeds a recorded log back into the callbacks.
+
+    :param path: The log written by the EventRecorder
+    :param sink: The function `sink(event, value)` that delivers the events, e.g. `EventManager.inject`
+    :param realtime: If True, the original time between events is kept (divided by `speed`). If False, the events are
+    delivered as fast as possible.
+    :param speed: Factor by which the replay is faster than the recording if `realtime` is True
+    :param events: Optional argument. A list of event names to replay. If omitted, all events are replayed.
+    :param is_shutdown: Optional function without arguments. The replay stops when it returns True.
+    :return: The number of events delivered
+    """
+    events = None if events is None else set(events)
+    count = 0
+    first = start = None
+    # Filter before unpickling so events that are not replayed cost nothing
+    for timestamp, event, data in EventLog(path)._raw_records():
+        if is_shutdown is not None and is_shutdown():
+            break
+        if events is not None and event not in events:
+            continue
+        if realtime:
+            if first is None:
+                first, start = timestamp, time.time()
+            delay = (timestamp - first) / speed - (time.time() - start)
+            if delay > 0:
+                time.sleep(delay)
+        sink(event, pickle.loads(data))
+        count += 1
+    return count
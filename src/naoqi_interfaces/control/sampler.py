@@ -0,0 +1,235 @@
+import naoqi_interfaces.comms.proxy_registry as proxies
+import naoqi_interfaces.control.stats as stats
+import numbers
+import threading
+import time
+import traceback
+
+_MISSING = object()
+
+
+def changed(old, new, threshold=0.):
+    """
+    :param old: The previous value
+    :param new: The new value
+    :param threshold: Numbers, and lists of numbers element-wise, only count as changed if they differ by more than
+    this. All other values count as changed if they are not equal.
+    :return: True if the value changed
+    """
+    if threshold > 0:
+        if isinstance(old, numbers.Number) and isinstance(new, numbers.Number):
+            return abs(new - old) > threshold
+        if isinstance(old, (list, tuple)) and isinstance(new, (list, tuple)) and len(old) == len(new):
+            return any(changed(o, n, threshold) for o, n in zip(old, new))
+    return old != new
+
+
+class KeyGroup(object):
+    """
+    A group of memory keys read together at a fixed rate by the Sampler.
+
+    :param keys: The list of memory keys
+    :param period: The time in seconds between two reads
+    :param handler: The function `handler(values)` called with a dictionary mapping the keys to their values if any of
+    them changed. The first read is always handed over.
+    :param threshold: Numbers only count as changed if they differ by more than this from the value last handed over
+    :param default: The value used for keys that do not exist
+    """
+    def __init__(self, keys, period, handler, threshold=0., default=None):
+        if period <= 0:
+            raise ValueError("The period of a key group has to be positive.")
+        if not keys:
+            raise ValueError("A key group needs at least one key.")
+        self.keys = list(keys)
+        self.period = period
+        self.handler = handler
+        self.threshold = threshold
+        self.default = default
+        self.name = getattr(handler, "__name__", repr(handler))
+        self.deadline = 0.
+        self.cancelled = False
+        self.values = None
+        self.reads = 0
+        self.changes = 0
+
+    def _update(self, values):
+        """
+        :param values: A dictionary mapping the keys of this group to their new values
+        :return: True if the values have to be handed to the handler
+        """
+        self.reads += 1
+        if self.values is not None and not any(
+                changed(self.values[k], values[k], self.threshold) for k in self.keys):
+            return False
+        self.values = values
+        self.changes += 1
+        return True
+
+    def stats(self):
+        return {
+            "keys": len(self.keys),
+            "period": self.period,
+            "reads": self.reads,
+            "changes": self.changes
+        }
+
+
+class Sampler(object):
+    """
+    Periodically reads memory keys that are not published as events. All groups that are due within `merge_window`
+    seconds of each other are read with a single `getListData` call, keys shared by several groups are only read once.
+    Handlers are executed on the thread of the sampler and should be fast.
+
+    :param merge_window: The time in seconds a group may be read early so it can share a call with another group
+    :param registry: Optional argument. The ProxyRegistry of the robot. If omitted, the process wide registry is used.
+    """
+    def __init__(self, merge_window=.005, registry=None):
+        self.merge_window = merge_window
+        self.registry = proxies.registry if registry is None else registry
+        self.groups = []
+        self.calls = 0
+        self.__cond = threading.Condition()
+        self.__stop = False
+        self.__thread = None
+
+    def add_group(self, keys, period, handler, threshold=0., default=None):
+        """
+        Adds a group of keys. Can be called before or while the sampler is running.
+
+        :param keys: The list of memory keys, e.g. built with naoqi_interfaces.comms.memory_accessor.person_keys
+        :param period: The time in seconds between two reads
+        :param handler: The function `handler(values)` called with a dictionary mapping the keys to their values if any
+        of them changed
+        :param threshold: Numbers only count as changed if they differ by more than this
+        :param default: The value used for keys that do not exist
+        :return: The KeyGroup. Can be given to `remove_group`.
+        """
+        group = KeyGroup(keys, period, handler, threshold=threshold, default=default)
+        with self.__cond:
+            group.deadline = time.time()
+            self.groups.append(group)
+            self.__cond.notify_all()
+        return group
+
+    def remove_group(self, group):
+        """
+        :param group: The KeyGroup returned by `add_group`
+        """
+        with self.__cond:
+            group.cancelled = True
+            if group in self.groups:
+                self.groups.remove(group)
+
+    def _due(self):
+        """
+        Waits until at least one group is due or the sampler is stopped.
+
+        :return: The list of groups to read now or None if the sampler was stopped
+        """
+        with self.__cond:
+            while not self.__stop:
+                now = time.time()
+                if self.groups:
+                    first = min(g.deadline for g in self.groups)
+                    if first <= now:
+                        return [g for g in self.groups if g.deadline <= now + self.merge_window]
+                    self.__cond.wait(first - now)
+                else:
+                    self.__cond.wait()
+            return None
+
+    def _read(self, keys):
+        memory = self.registry.get_proxy("ALMemory")
+        self.calls += 1
+        try:
+            return memory.getListData(keys)
+        except RuntimeError:
+            # At least one key does not exist. Fall back to single reads to find out which.
+            values = []
+            for key in keys:
+                try:
+                    values.append(memory.getData(key))
+                except RuntimeError:
+                    values.append(_MISSING)
+            return values
+
+    def sample(self, groups):
+        """
+        Reads the keys of the given groups with a single call and hands the values to the handlers of the groups that
+        changed.
+
+        :param groups: A list of KeyGroups
+        """
+        keys = []
+        seen = set()
+        for g in groups:
+            for k in g.keys:
+                if k not in seen:
+                    seen.add(k)
+                    keys.append(k)
+        read = self._read
+        if stats.collector.enabled:
+            read = stats.collector.timed("ALMemory.getListData", read)
+        values = dict(zip(keys, read(keys)))
+        for g in groups:
+            group_values = dict((k, g.default if values[k] is _MISSING else values[k]) for k in g.keys)
+            if g._update(group_values) and not g.cancelled:
+                try:
+                    g.handler(group_values)
+                except Exception:
+                    print "Exception in sampler handler '%s':" % g.name
+                    traceback.print_exc()
+
+    def _schedule(self, groups):
+        now = time.time()
+        with self.__cond:
+            for g in groups:
+                g.deadline += g.period
+                if g.deadline < now:
+                    # Skip missed reads instead of catching up
+                    g.deadline = now + g.period
+
+    def run(self):
+        """
+        Blocking until `stop` is called. Use `start` to run the sampler in the background.
+        """
+        while True:
+            groups = self._due()
+            if groups is None:
+                return
+            try:
+                self.sample(groups)
+            except RuntimeError as e:
+                print "Warning: Sampling memory failed:", e
+            self._schedule(groups)
+
+    def start(self):
+        """
+        Starts reading in the background.
+        """
+        with self.__cond:
+            if self.__thread is not None:
+                return
+            self.__stop = False
+            self.__thread = threading.Thread(target=self.run, name="memory-sampler")
+            self.__thread.daemon = True
+            self.__thread.start()
+
+    def stop(self, timeout=None):
+        """
+        :param timeout: Optional argument. Maximum time in seconds to wait for the sampler thread to finish.
+        """
+        with self.__cond:
+            self.__stop = True
+            self.__cond.notify_all()
+            thread, self.__thread = self.__thread, None
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def stats(self):
+        """
+        :return: A dictionary with the number of calls to ALMemory and the statistics of every group by handler name
+        """
+        with self.__cond:
+            groups = list(self.groups)
+        return {"calls": self.calls, "groups": dict((g.name, g.stats()) for g in groups)}
@@ -0,0 +1,213 @@
+import naoqi_interfaces.control.profiler as profiling
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+
+class Task(object):
+    """
+    A function executed by the Scheduler. Either periodically, whenever an event fires, or both.
+
+    :param func: The function to execute. Cannot have arguments.
+    :param period: Optional argument. The time in seconds between two executions.
+    :param trigger: Optional argument. The name of an event (or a list of names) that triggers an execution.
+    """
+    def __init__(self, func, period=None, trigger=None):
+        if period is None and trigger is None:
+            raise ValueError("A task needs a period, a trigger, or both.")
+        if period is not None and period <= 0:
+            raise ValueError("The period of a task has to be positive.")
+        self.func = func
+        self.name = getattr(func, "__name__", repr(func))
+        self.period = period
+        self.triggers = () if trigger is None else (trigger,) if isinstance(trigger, str) else tuple(trigger)
+        self.pending = False
+        self.cancelled = False
+        self.runs = 0
+        self.overruns = 0
+        self.total_duration = 0.
+        self.max_duration = 0.
+        self.max_lateness = 0.
+
+    def stats(self):
+        """
+        :return: A dictionary with the number of executions, overruns, and the mean and maximum duration as well as
+        the maximum delay of an execution after its deadline in seconds.
+        """
+        return {
+            "period": self.period,
+            "triggers": self.triggers,
+            "runs": self.runs,
+            "overruns": self.overruns,
+            "mean_duration": self.total_duration / self.runs if self.runs else 0.,
+            "max_duration": self.max_duration,
+            "max_lateness": self.max_lateness
+        }
+
+
+class Scheduler(object):
+    """
+    Executes tasks at their own rate or when an event fires. The deadlines of all periodic tasks are kept in a heap
+    and the scheduler sleeps until the next deadline, until an event triggers a task, or until it is stopped. An
+    execution that takes longer than the period of its task counts as an overrun and the missed executions are skipped.
+    """
+    def __init__(self):
+        self.__cond = threading.Condition()
+        self.__heap = []
+        self.__triggered = []
+        self.__by_trigger = {}
+        self.__counter = itertools.count()
+        self.__running = False
+        self.__stop_requested = False
+        self.tasks = []
+
+    def add_task(self, func, period=None, trigger=None):
+        """
+        Adds a task. Can be called before or while the scheduler is running.
+
+        :param func: The function to execute. Cannot have arguments.
+        :param period: Optional argument. The time in seconds between two executions.
+        :param trigger: Optional argument. The name of an event (or a list of names) that triggers an execution.
+        :return: The Task object which can be used to remove the task again or to get its statistics
+        """
+        task = Task(func, period=period, trigger=trigger)
+        with self.__cond:
+            self.tasks.append(task)
+            for t in task.triggers:
+                self.__by_trigger.setdefault(t, []).append(task)
+            if task.period is not None:
+                heapq.heappush(self.__heap, (time.time(), next(self.__counter), task))
+            self.__cond.notify()
+        return task
+
+    def remove_task(self, task):
+        """
+        Removes a task. It will not be executed again.
+
+        :param task: The Task object returned by `add_task`
+        """
+        with self.__cond:
+            task.cancelled = True
+            if task in self.tasks:
+                self.tasks.remove(task)
+            for t in task.triggers:
+                self.__by_trigger[t].remove(task)
+
+    def trigger(self, event):
+        """
+        Marks all tasks waiting for the given event to be executed as soon as possible. A task that is already
+        waiting to be executed is not queued twice. Cheap enough to be called from the NAOqi callback thread.
+
+        :param event: The name of the event that fired
+        """
+        tasks = self.__by_trigger.get(event)
+        if not tasks:
+            return
+        with self.__cond:
+            for task in tasks:
+                if not task.pending:
+                    task.pending = True
+                    self.__triggered.append((time.time(), task))
+            self.__cond.notify()
+
+    def _next(self):
+        """
+        Blocks until a task is due or the scheduler is stopped. Has to be called with the lock held.
+
+        :return: A tuple of (deadline, task, periodic) or None if the scheduler was stopped
+        """
+        while not self.__stop_requested:
+            if self.__triggered:
+                deadline, task = self.__triggered.pop(0)
+                task.pending = False
+                if not task.cancelled:
+                    return deadline, task, False
+                continue
+            if self.__heap:
+                deadline, _, task = self.__heap[0]
+                if task.cancelled:
+                    heapq.heappop(self.__heap)
+                    continue
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    heapq.heappop(self.__heap)
+                    return deadline, task, True
+                self.__cond.wait(timeout)
+            else:
+                # On Python 2 waiting without a timeout cannot be interrupted, so Ctrl+C would never be handled
+                self.__cond.wait(1.)
+        return None
+
+    def _execute(self, deadline, task):
+        start = time.time()
+        try:
+            if profiling.profiler.enabled:
+                profiling.profiler.run("task:%s" % task.name, task.func)
+            else:
+                task.func()
+        except Exception:
+            print "Exception in task '%s':" % task.name
+            traceback.print_exc()
+        end = time.time()
+        duration = end - start
+        task.runs += 1
+        task.total_duration += duration
+        task.max_duration = max(task.max_duration, duration)
+        task.max_lateness = max(task.max_lateness, start - deadline)
+        if task.period is not None and duration > task.period:
+            task.overruns += 1
+        return end
+
+    def run(self):
+        """
+        Executes the tasks until `stop` is called. Blocking.
+        """
+        with self.__cond:
+            self.__running = True
+        try:
+            while True:
+                with self.__cond:
+                    due = self._next()
+                if due is None:
+                    break
+                deadline, task, periodic = due
+                end = self._execute(deadline, task)
+                if not periodic or task.cancelled:
+                    continue
+                with self.__cond:
+                    next_deadline = deadline + task.period
+                    if next_deadline < end:
+                        # Missed at least one deadline. Skip the missed executions instead of running them back to back.
+                        next_deadline = end + task.period
+                    heapq.heappush(self.__heap, (next_deadline, next(self.__counter), task))
+        finally:
+            with self.__cond:
+                self.__running = False
+
+    def stop(self):
+        """
+        Stops the scheduler. The currently running task is finished first. Can be called from any thread.
+        """
+        with self.__cond:
+            self.__stop_requested = True
+            self.__cond.notify_all()
+
+    def is_running(self):
+        return self.__running
+
+    def stats(self):
+        """
+        :return: A dictionary mapping task names to their statistics. See `Task.stats`. If several tasks have the same
+        name, a running number is appended, e.g. "my_control_loop#2".
+        """
+        result = {}
+        with self.__cond:
+            for t in self.tasks:
+                name, i = t.name, 1
+                while name in result:
+                    i += 1
+                    name = "%s#%d" % (t.name, i)
+                result[name] = t.stats()
+        return result
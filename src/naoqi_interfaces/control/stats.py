@@ -0,0 +1,212 @@
+from collections import deque
+import threading
+import time
+import traceback
+
+
+def _percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100. * (len(sorted_values) - 1))))]
+
+
+class LatencyStats(object):
+    """
+    Counts calls and keeps the most recent durations and queue waiting times to compute percentiles.
+
+    :param window: The number of most recent samples used for the percentiles
+    """
+    def __init__(self, window=1024):
+        self.__lock = threading.Lock()
+        self.count = 0
+        self.errors = 0
+        self.total = 0.
+        self.max = 0.
+        self.first = None
+        self.last = None
+        self.durations = deque(maxlen=window)
+        self.waits = deque(maxlen=window)
+
+    def record(self, start, duration, wait=None, error=False):
+        with self.__lock:
+            self.count += 1
+            self.errors += error
+            self.total += duration
+            self.max = max(self.max, duration)
+            if self.first is None:
+                self.first = start
+            self.last = start
+            self.durations.append(duration)
+            if wait is not None:
+                self.waits.append(wait)
+
+    def snapshot(self):
+        """
+        :return: A dictionary with the number of calls and errors, the rate in calls per second, and the mean, p50,
+        p99, and maximum duration as well as the p50 and p99 of the time spent in a queue in seconds.
+        """
+        with self.__lock:
+            durations = sorted(self.durations)
+            waits = sorted(self.waits)
+            elapsed = (self.last - self.first) if self.count > 1 else 0.
+            return {
+                "count": self.count,
+                "errors": self.errors,
+                "rate": (self.count - 1) / elapsed if elapsed > 0 else 0.,
+                "mean": self.total / self.count if self.count else 0.,
+                "p50": _percentile(durations, 50),
+                "p99": _percentile(durations, 99),
+                "max": self.max,
+                "wait_p50": _percentile(waits, 50),
+                "wait_p99": _percentile(waits, 99)
+            }
+
+
+class StatsCollector(object):
+    """
+    Collects timings of event callbacks and proxy calls per event name, per callback, and per proxy method. Disabled by
+    default. When disabled, the instrumented code paths only check the `enabled` flag.
+
+    :param window: The number of most recent samples used for the percentiles of every entry
+    """
+    EVENTS = "events"
+    CALLBACKS = "callbacks"
+    PROXIES = "proxies"
+
+    def __init__(self, window=1024):
+        self.enabled = False
+        self.window = window
+        self.__lock = threading.Lock()
+        self.__stats = {self.EVENTS: {}, self.CALLBACKS: {}, self.PROXIES: {}}
+
+    def get(self, kind, name):
+        """
+        :param kind: One of EVENTS, CALLBACKS, or PROXIES
+        :param name: The name of the event, callback, or proxy method
+        :return: The LatencyStats for the given entry. Created if it does not exist.
+        """
+        entries = self.__stats[kind]
+        try:
+            return entries[name]
+        except KeyError:
+            with self.__lock:
+                return entries.setdefault(name, LatencyStats(self.window))
+
+    def call_callback(self, event, callback, args, enqueued=None):
+        """
+        Executes an event callback and records its duration for the event and the callback. Exceptions are re-raised.
+
+        :param event: The name of the event
+        :param callback: The callback as a bound method
+        :param args: The list of arguments for the callback
+        :param enqueued: Optional argument. The time the payload was put into a queue.
+        """
+        start = time.time()
+        error = False
+        try:
+            return callback(*args)
+        except Exception:
+            error = True
+            raise
+        finally:
+            duration = time.time() - start
+            wait = None if enqueued is None else start - enqueued
+            self.get(self.EVENTS, event).record(start, duration, wait, error)
+            self.get(self.CALLBACKS, callback_name(callback)).record(start, duration, wait, error)
+
+    def timed(self, name, func):
+        """
+        Wraps a function so its calls are recorded as proxy calls under the given name.
+
+        :param name: The name to record the calls under, e.g. "ALTextToSpeech.say"
+        :param func: The function to wrap
+        :return: The wrapped function
+        """
+        stats = self.get(self.PROXIES, name)
+
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return func(*args, **kwargs)
+            start = time.time()
+            error = False
+            try:
+                return func(*args, **kwargs)
+            except Exception:
+                error = True
+                raise
+            finally:
+                stats.record(start, time.time() - start, error=error)
+        wrapper.__name__ = getattr(func, "__name__", name)
+        return wrapper
+
+    def snapshot(self):
+        """
+        :return: A dictionary mapping EVENTS, CALLBACKS, and PROXIES to dictionaries mapping names to their statistics.
+        See LatencyStats.snapshot.
+        """
+        with self.__lock:
+            entries = dict((k, dict(v)) for k, v in self.__stats.items())
+        return dict((k, dict((n, s.snapshot()) for n, s in v.items())) for k, v in entries.items())
+
+    def reset(self):
+        """
+        Removes all recorded statistics.
+        """
+        with self.__lock:
+            for entries in self.__stats.values():
+                entries.clear()
+
+
+def callback_name(callback):
+    """
+    :param callback: A function or bound method
+    :return: A readable name, e.g. "MultiEvent.callback_person"
+    """
+    instance = getattr(callback, "im_self", None)
+    name = getattr(callback, "__name__", repr(callback))
+    return name if instance is None else "%s.%s" % (instance.__class__.__name__, name)
+
+
+def format_stats(stats):
+    """
+    Formats the statistics returned by `StatsCollector.snapshot` as a table.
+
+    :param stats: The dictionary returned by `StatsCollector.snapshot`
+    :return: A string
+    """
+    lines = []
+    for kind in (StatsCollector.EVENTS, StatsCollector.CALLBACKS, StatsCollector.PROXIES):
+        entries = stats.get(kind, {})
+        if not entries:
+            continue
+        lines.append("%-48s %8s %8s %10s %10s %10s %10s" % (kind, "count", "rate/s", "p50 ms", "p99 ms", "max ms",
+                                                             "wait99 ms"))
+        for name, s in sorted(entries.items()):
+            lines.append("%-48s %8d %8.1f %10.2f %10.2f %10.2f %10.2f" % (
+                name, s["count"], s["rate"], s["p50"] * 1e3, s["p99"] * 1e3, s["max"] * 1e3, s["wait_p99"] * 1e3))
+    return "\n".join(lines)
+
+
+collector = StatsCollector()
+
+
+def call_callback(event, callback, args, enqueued=None):
+    """
+    Executes an event callback. Its duration is recorded if the collector is enabled, see
+    `StatsCollector.call_callback`.
+    """
+    if collector.enabled:
+        return collector.call_callback(event, callback, args, enqueued)
+    return callback(*args)
+
+
+def print_stats(stats):
+    """
+    Default function used by EventManager.dump_stats.
+
+    :param stats: The dictionary returned by EventManager.stats
+    """
+    try:
+        print format_stats(stats)
+    except Exception:
+        traceback.print_exc()
@@ -0,0 +1,277 @@
+"""
+Typed decoders for the payloads of common perception events. Instead of indexing nested lists like
+`args[1][1][0][0]`, a callback of an event with a decoder receives a compact record:
+
+    Event(event_name="PeoplePerception/PeopleDetected", proxy_name="ALPeoplePerception",
+          callback="callback_person", decoder=True)
+
+    def callback_person(self, event, people, subscriber):
+        print people.ids()
+        print people.distances()  # NumPy array if NumPy is installed
+
+`decoder=True` uses the decoder registered for the event name, any other function taking the raw value can be given
+instead. The records keep a reference to the raw value and only create the per person/face objects when accessed.
+"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+PEOPLE_DETECTED = "PeoplePerception/PeopleDetected"
+FACE_DETECTED = "FaceDetected"
+PEOPLE_LOOKING_AT_ROBOT = "GazeAnalysis/PeopleLookingAtRobot"
+
+
+def _require_numpy():
+    if numpy is None:
+        raise ImportError("NumPy is required for array access to decoded events.")
+
+
+def _timestamp(value):
+    # NAOqi time stamps are [seconds, microseconds]
+    return value[0] + value[1] * 1e-6
+
+
+class Person(object):
+    """
+    A person detected by ALPeoplePerception.
+    """
+    __slots__ = ("id", "distance", "pitch", "yaw")
+
+    def __init__(self, id, distance, pitch, yaw):
+        self.id = id
+        self.distance = distance
+        self.pitch = pitch
+        self.yaw = yaw
+
+    def __repr__(self):
+        return "Person(id=%d, distance=%.2f, pitch=%.3f, yaw=%.3f)" % (self.id, self.distance, self.pitch, self.yaw)
+
+    def position(self):
+        """
+        :return: An approximation of the position (x forward, y left, z up) of the person in the camera frame in metres
+        """
+        return (
+            self.distance * math.cos(self.pitch) * math.cos(self.yaw),
+            self.distance * math.cos(self.pitch) * math.sin(self.yaw),
+            -self.distance * math.sin(self.pitch)
+        )
+
+
+class PeopleDetected(object):
+    """
+    The decoded value of PeoplePerception/PeopleDetected:
+    [TimeStamp, [PersonData_1, ... PersonData_n], CameraPose_InTorsoFrame, CameraPose_InRobotFrame, Camera_Id]
+    with PersonData = [Id, DistanceToCamera, PitchAngleInImage, YawAngleInImage]
+    """
+    __slots__ = ("raw", "timestamp", "camera_pose_torso", "camera_pose_robot", "camera_id", "_people")
+
+    def __init__(self, value):
+        self.raw = value
+        if value:
+            self.timestamp = _timestamp(value[0])
+            self.camera_pose_torso = value[2]
+            self.camera_pose_robot = value[3]
+            self.camera_id = value[4]
+        else:
+            self.timestamp = self.camera_pose_torso = self.camera_pose_robot = self.camera_id = None
+        self._people = None
+
+    def _data(self):
+        return self.raw[1] if self.raw else []
+
+    def __len__(self):
+        return len(self._data())
+
+    def __iter__(self):
+        return iter(self.people)
+
+    def __repr__(self):
+        return "PeopleDetected(timestamp=%s, people=%r)" % (str(self.timestamp), self.people)
+
+    @property
+    def people(self):
+        """
+        :return: A list of Person records. Created on first access.
+        """
+        if self._people is None:
+            self._people = [Person(*p[:4]) for p in self._data()]
+        return self._people
+
+    def ids(self):
+        return [p[0] for p in self._data()]
+
+    def array(self):
+        """
+        :return: A NumPy array of shape (n, 4) with the columns id, distance, pitch, yaw
+        """
+        _require_numpy()
+        data = self._data()
+        if not data:
+            return numpy.empty((0, 4))
+        return numpy.array([p[:4] for p in data], dtype=float)
+
+    def distances(self):
+        """
+        :return: The distances of all people to the camera in metres as a NumPy array
+        """
+        return self.array()[:, 1]
+
+    def positions(self):
+        """
+        :return: A NumPy array of shape (n, 3) with an approximation of the position (x forward, y left, z up) of all
+        people in the camera frame in metres. See Person.position.
+        """
+        a = self.array()
+        distance, pitch, yaw = a[:, 1], a[:, 2], a[:, 3]
+        horizontal = distance * numpy.cos(pitch)
+        return numpy.column_stack((horizontal * numpy.cos(yaw), horizontal * numpy.sin(yaw), -distance * numpy.sin(pitch)))
+
+
+class Face(object):
+    """
+    A face detected by ALFaceDetection. Angles are the position of the face centre in the camera image in radians,
+    sizes are relative to the image size.
+    """
+    __slots__ = ("alpha", "beta", "size_x", "size_y", "face_id", "score", "label")
+
+    def __init__(self, alpha, beta, size_x, size_y, face_id, score, label):
+        self.alpha = alpha
+        self.beta = beta
+        self.size_x = size_x
+        self.size_y = size_y
+        self.face_id = face_id
+        self.score = score
+        self.label = label
+
+    def __repr__(self):
+        return "Face(alpha=%.3f, beta=%.3f, size=%.3fx%.3f, label=%r)" % (
+            self.alpha, self.beta, self.size_x, self.size_y, self.label)
+
+
+class FaceDetected(object):
+    """
+    The decoded value of FaceDetected:
+    [TimeStamp, [FaceInfo_1, ... FaceInfo_n, Time_Filtered_Reco_Info], CameraPose_InTorsoFrame,
+    CameraPose_InRobotFrame, Camera_Id]
+    with FaceInfo = [ShapeInfo, ExtraInfo], ShapeInfo = [0, alpha, beta, sizeX, sizeY], and
+    ExtraInfo = [faceID, scoreReco, faceLabel, ...]
+    """
+    __slots__ = ("raw", "timestamp", "camera_pose_torso", "camera_pose_robot", "camera_id", "_faces")
+
+    def __init__(self, value):
+        self.raw = value
+        if value:
+            self.timestamp = _timestamp(value[0])
+            self.camera_pose_torso = value[2]
+            self.camera_pose_robot = value[3]
+            self.camera_id = value[4]
+        else:
+            self.timestamp = self.camera_pose_torso = self.camera_pose_robot = self.camera_id = None
+        self._faces = None
+
+    def _data(self):
+        # The last element is the time filtered recognition info, not a face
+        return self.raw[1][:-1] if self.raw else []
+
+    def __len__(self):
+        return len(self._data())
+
+    def __iter__(self):
+        return iter(self.faces)
+
+    def __repr__(self):
+        return "FaceDetected(timestamp=%s, faces=%r)" % (str(self.timestamp), self.faces)
+
+    @property
+    def faces(self):
+        """
+        :return: A list of Face records. Created on first access.
+        """
+        if self._faces is None:
+            self._faces = [Face(f[0][1], f[0][2], f[0][3], f[0][4], f[1][0], f[1][1], f[1][2]) for f in self._data()]
+        return self._faces
+
+    def labels(self):
+        return [f[1][2] for f in self._data()]
+
+    def array(self):
+        """
+        :return: A NumPy array of shape (n, 4) with the columns alpha, beta, size_x, size_y
+        """
+        _require_numpy()
+        data = self._data()
+        if not data:
+            return numpy.empty((0, 4))
+        return numpy.array([f[0][1:5] for f in data], dtype=float)
+
+
+class PeopleLookingAtRobot(object):
+    """
+    The decoded value of GazeAnalysis/PeopleLookingAtRobot: a list of the IDs of the people looking at the robot.
+    """
+    __slots__ = ("ids",)
+
+    def __init__(self, value):
+        self.ids = list(value) if value else []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    def __contains__(self, person_id):
+        return person_id in self.ids
+
+    def __repr__(self):
+        return "PeopleLookingAtRobot(ids=%r)" % self.ids
+
+    def array(self):
+        _require_numpy()
+        return numpy.array(self.ids, dtype=int)
+
+
+_decoders = {
+    PEOPLE_DETECTED: PeopleDetected,
+    FACE_DETECTED: FaceDetected,
+    PEOPLE_LOOKING_AT_ROBOT: PeopleLookingAtRobot
+}
+
+
+def register_decoder(event, decoder):
+    """
+    Registers the default decoder for an event name, used for events with `decoder=True`.
+
+    :param event: The name of the event
+    :param decoder: A function taking the raw value of the event and returning the decoded value
+    """
+    _decoders[event] = decoder
+
+
+def get_decoder(event):
+    """
+    :param event: The name of the event
+    :return: The default decoder for the event
+    """
+    try:
+        return _decoders[event]
+    except KeyError:
+        raise KeyError("No decoder registered for '%s'" % event)
+
+
+def resolve_decoder(event, decoder):
+    """
+    :param event: The name of the event
+    :param decoder: None, True to use the default decoder of the event, or a decoder function
+    :return: The decoder function or None
+    """
+    if decoder is None or decoder is False:
+        return None
+    if decoder is True:
+        return get_decoder(event)
+    if not callable(decoder):
+        raise TypeError("Decoders have to be functions, True, or None.")
+    return decoder
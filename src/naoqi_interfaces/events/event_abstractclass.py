@@ -1,13 +1,25 @@
-from naoqi import ALProxy, ALModule
+from naoqi import ALModule
 from abc import ABCMeta, abstractmethod
+import naoqi_interfaces.comms.proxy_registry as proxies
+from naoqi_interfaces.comms.memory_accessor import MemoryAccessor
+import naoqi_interfaces.control.profiler as profiling
+import naoqi_interfaces.control.stats as stats
+from naoqi_interfaces.events.decoders import resolve_decoder
+from naoqi_interfaces.events.history import EventHistory
 import uuid
-import time
 
 
 class EventAbstractclass(ALModule):
     __metaclass__ = ABCMeta
 
-    def __init__(self, event, proxy_name, name=""):
+    # Default time in seconds values read via `get_memory_data` are cached. Override in the inheriting class to enable.
+    memory_ttl = 0.
+    # Number of values kept per event for `history`, `latest`, `window`, and `since`. Override in the inheriting class
+    # to enable for all its events or use `keep_history`.
+    history_size = 0
+    history_max_age = None
+
+    def __init__(self, event, proxy_name, name="", decoder=None):
         """
         The constructor of the base abstract class.
         
@@ -16,13 +28,28 @@ class EventAbstractclass(ALModule):
         "ALFaceDetection"
         :param name: Option argument. Can be used to define an explicit name fo the global variable that holds the 
         instance of the inheriting class. If not defined `inst.__class__.__name__+"_inst"` will be used
+        :param decoder: Optional argument. True to hand the callback the value decoded by the decoder registered for
+        the event, or a function decoding the value. See naoqi_interfaces.events.decoders.
         """
         self.__event__ = event
+        self.__decoder__ = decoder
         self._name = str(uuid.uuid4()).replace('-', '_') if name == "" else name
         self._make_global(self._name, self)
         self.__proxy_name__ = proxy_name
         self.__memory__ = None
+        self.__memory_accessor__ = None
         self.__is_shutdown = False
+        self._callbacks = {}
+        self._decoders = {}
+        self._histories = {}
+        self._paused = set()
+        self._dispatcher = None
+        self._dispatch_policies = {}
+        self._event_bus = None
+        self._observers = []
+        self._subscriptions = {}
+        self._proxy_names = set()
+        self._registry = proxies.registry
 
     def __del__(self):
         self.__is_shutdown = True
@@ -39,25 +66,267 @@ class EventAbstractclass(ALModule):
         globals()[name] = var
         return globals()[name]
 
-    def _subscribe(self):
+    def _subscribe_event(self, event, callback, decoder=None):
         """
-        Subscribes to the event given during construction.
+        Subscribes the given callback to an event. If a dispatcher or decoder is set, NAOqi calls `on_event` instead
+        which decodes the value and hands the payload over to the dispatcher.
+
+        :param event: The name of the event, e.g. "FaceDetected"
+        :param callback: The callback as a method of this class or its name as a string. None to only receive the
+        event in `_deliver`, e.g. for joins.
+        :param decoder: Optional argument. True to use the decoder registered for the event, or a decoder function.
         """
+        callback_name, decoder = self._set_callback(event, callback, decoder)
+        if self.history_size and event not in self._histories:
+            self._histories[event] = EventHistory(self.history_size, self.history_max_age)
+        if self._dispatcher is not None:
+            self._dispatcher.register((self._name, event), *self._dispatch_policies.get(
+                event, self._dispatch_policies.get(None, (None, None))))
+        if self._event_bus is not None:
+            self._event_bus.add(event, self)
+            return
+        direct = self._dispatcher is None and not self._observers and decoder is None and callback_name is not None \
+            and event not in self._histories
+        method = callback_name if direct else self.on_event.func_name
         self.__memory__.subscribeToEvent(
-            self.__event__,
+            event,
             self._name,
-            self.callback.func_name
+            method
         )
+        self._subscriptions[event] = method
 
-    def _unsubscribe(self):
+    def _set_callback(self, event, callback, decoder=None):
         """
-        Unsubscribes from the event given during construction.
+        Sets the callback and decoder used for an event locally without subscribing in NAOqi.
+
+        :param event: The name of the event, e.g. "FaceDetected"
+        :param callback: The callback as a method of this class, its name as a string, or None
+        :param decoder: Optional argument. True to use the decoder registered for the event, or a decoder function.
+        :return: A tuple of the name of the callback and the decoder function
         """
+        callback_name = callback if isinstance(callback, (str, type(None))) else callback.func_name
+        self._callbacks[event] = None if callback_name is None else getattr(self, callback_name)
+        decoder = resolve_decoder(event, decoder)
+        if decoder is not None:
+            self._decoders[event] = decoder
+        else:
+            self._decoders.pop(event, None)
+        return callback_name, decoder
+
+    def _unsubscribe_event(self, event):
+        """
+        Unsubscribes from an event.
+
+        :param event: The name of the event, e.g. "FaceDetected"
+        """
+        self._callbacks.pop(event, None)
+        self._decoders.pop(event, None)
+        if self._event_bus is not None:
+            self._event_bus.remove(event, self)
+            return
+        self._subscriptions.pop(event, None)
         self.__memory__.unsubscribeToEvent(
-            self.__event__,
+            event,
             self._name
         )
 
+    def _subscribe(self):
+        """
+        Subscribes to the event given during construction.
+        """
+        self._subscribe_event(self.__event__, self.callback, self.__decoder__)
+
+    def _unsubscribe(self):
+        """
+        Unsubscribes from the event given during construction.
+        """
+        self._unsubscribe_event(self.__event__)
+
+    def on_event(self, *args):
+        """
+        Called by NAOqi instead of the callback if a dispatcher, decoders, or observers are used. Do not override or
+        call this yourself.
+
+        :param args: The event name, the value, and the subscriber identifier as given by NAOqi
+        """
+        for observer in self._observers:
+            observer(args[0], args)
+        self._deliver(args[0], args)
+
+    def _deliver(self, event, args):
+        """
+        Executes the callback for the given event directly or hands it to the dispatcher if one is set. If the event
+        has a decoder, the value is replaced by the decoded value first. Observers always see the raw value.
+
+        :param event: The name of the event the payload belongs to
+        :param args: The list of arguments for the callback
+        :return: The arguments handed to the callback or None if the event is paused
+        """
+        if event in self._paused:
+            return None
+        decoder = self._decoders.get(event)
+        if decoder is not None:
+            args = (args[0], decoder(args[1])) + tuple(args[2:])
+        history = self._histories.get(event)
+        if history is not None:
+            history.append(args[1])
+        callback = self._callbacks.get(event)
+        if callback is not None:
+            self._run_callback(event, callback, args)
+        return args
+
+    def pause(self, *events):
+        """
+        Stops handing the given events to the callbacks without unsubscribing from them, so NAOqi keeps its
+        extractors running and `resume` is immediate. Payloads received while paused are discarded.
+
+        :param events: The names of the events. If omitted, all events this class is subscribed to are paused.
+        """
+        self._paused.update(events if events else self._callbacks.keys())
+
+    def resume(self, *events):
+        """
+        Hands the given events to the callbacks again after `pause`.
+
+        :param events: The names of the events. If omitted, all paused events are resumed.
+        """
+        if events:
+            self._paused.difference_update(events)
+        else:
+            self._paused.clear()
+
+    def is_paused(self, event=None):
+        """
+        :param event: Optional argument. The name of the event. If omitted, the event given during construction is used.
+        :return: True if the event is paused
+        """
+        return (self.__event__ if event is None else event) in self._paused
+
+    def _run_callback(self, name, callback, args):
+        """
+        Executes a callback directly or hands it to the dispatcher if one is set.
+
+        :param name: The name of the event or join the callback belongs to. Used as the dispatcher queue and for
+        statistics and profiling.
+        :param callback: The callback
+        :param args: The list of arguments for the callback
+        """
+        if self._dispatcher is not None:
+            self._dispatcher.submit((self._name, name), callback, args)
+        elif profiling.profiler.enabled:
+            profiling.profiler.run("event:%s" % name, stats.call_callback, name, callback, args)
+        elif stats.collector.enabled:
+            stats.collector.call_callback(name, callback, args)
+        else:
+            callback(*args)
+
+    def set_dispatcher(self, dispatcher):
+        """
+        Runs the callbacks of this class on the worker threads of the given dispatcher instead of the NAOqi callback
+        thread. Has to be called before `start`. Called by the EventManager if it was given a dispatcher.
+
+        :param dispatcher: An instance of naoqi_interfaces.control.dispatcher.Dispatcher or None to run the callbacks
+        directly on the NAOqi callback thread.
+        """
+        self._dispatcher = dispatcher
+
+    def add_observer(self, observer):
+        """
+        Registers a function that is called with the event name and the list of arguments for every payload this class
+        receives, before the callback is executed. Observers run on the NAOqi callback thread and should be fast.
+        Has to be called before `start`. Used by the EventManager.
+
+        :param observer: The function `observer(event_name, args)`
+        """
+        self._observers.append(observer)
+
+    def set_event_bus(self, event_bus):
+        """
+        Receives the events of this class via the given event bus instead of subscribing to them in NAOqi directly.
+        Has to be called before `start`. Called by the EventManager.
+
+        :param event_bus: An instance of naoqi_interfaces.control.event_bus.EventBus or None to subscribe directly.
+        """
+        self._event_bus = event_bus
+
+    def set_registry(self, registry):
+        """
+        Creates the proxies of this class via the given registry instead of the process wide one. Has to be called
+        before `initialise_proxies_and_memory`. Called by the EventManager if it was given a registry.
+
+        :param registry: An instance of naoqi_interfaces.comms.proxy_registry.ProxyRegistry
+        """
+        self._registry = registry
+
+    def set_dispatch_policy(self, policy, maxsize=None, event=None):
+        """
+        Defines how payloads are queued if a dispatcher is used. Has to be called before `start`.
+
+        :param policy: The overflow policy, one of BLOCK, DROP_OLDEST, DROP_NEWEST, or COALESCE from
+        naoqi_interfaces.control.dispatcher
+        :param maxsize: Optional argument. The maximum queue length. If omitted, the default of the dispatcher is used.
+        :param event: Optional argument. The event the policy applies to. If omitted, it applies to all events of this
+        class that do not have their own policy.
+        """
+        self._dispatch_policies[event] = (policy, maxsize)
+
+    def keep_history(self, size=100, max_age=None, event=None):
+        """
+        Keeps the latest values of an event, so they can be read via `latest`, `window`, and `since` instead of
+        reading ALMemory. Has to be called before `start`. The values are stored as handed to the callback, i.e.
+        decoded if the event has a decoder.
+
+        :param size: The maximum number of values kept
+        :param max_age: Optional argument. The maximum age in seconds of the values returned by the queries.
+        :param event: Optional argument. The name of the event. If omitted, the event given during construction is used.
+        :return: The naoqi_interfaces.events.history.EventHistory
+        """
+        event = self._history_event(event)
+        history = self._histories[event] = EventHistory(size, max_age)
+        return history
+
+    def _history_event(self, event):
+        if event is None:
+            event = self.__event__
+            if event is None:
+                raise ValueError("The event has to be given for classes with several events.")
+        return event
+
+    def history(self, event=None):
+        """
+        :param event: Optional argument. The name of the event. If omitted, the event given during construction is used.
+        :return: The EventHistory of the event
+        :raises KeyError: If no history is kept for the event
+        """
+        event = self._history_event(event)
+        try:
+            return self._histories[event]
+        except KeyError:
+            raise KeyError("No history is kept for '%s'. Use keep_history or history_size." % event)
+
+    def latest(self, event=None):
+        """
+        :param event: Optional argument. The name of the event. If omitted, the event given during construction is used.
+        :return: The latest tuple (timestamp, value) of the event or None if it has not been received, yet
+        """
+        return self.history(event).latest()
+
+    def window(self, seconds, event=None):
+        """
+        :param seconds: The length of the window
+        :param event: Optional argument. The name of the event. If omitted, the event given during construction is used.
+        :return: A list of all tuples (timestamp, value) of the event received in the last `seconds`, oldest first
+        """
+        return self.history(event).window(seconds)
+
+    def since(self, timestamp, event=None):
+        """
+        :param timestamp: The time in seconds since the epoch
+        :param event: Optional argument. The name of the event. If omitted, the event given during construction is used.
+        :return: A list of all tuples (timestamp, value) of the event received at or after the given time, oldest first
+        """
+        return self.history(event).since(timestamp)
+
     def sync_global(self, glob):
         """
         Syncing the global variable that hold the instance of this class to the dictionary of global variables provided 
@@ -79,21 +348,47 @@ class EventAbstractclass(ALModule):
         """
         return getattr(self, self.__proxy_name__ if proxy_name == "" else proxy_name)
 
+    def get_memory_data(self, keys, ttl=None, default=None):
+        """
+        Reads one or several keys from the memory with a single call. Values are cached for `memory_ttl` seconds.
+        Use `self.__memory_accessor__` directly for cache statistics and per key ttls.
+
+        :param keys: A single memory key or a list of keys, e.g. built with
+        naoqi_interfaces.comms.memory_accessor.person_keys
+        :param ttl: Optional argument. Maximum age in seconds of a cached value to be used for this read.
+        :param default: Optional argument. Returned for keys that do not exist.
+        :return: The value or list of values in the same order as the keys
+        """
+        if isinstance(keys, str):
+            return self.__memory_accessor__.get_data(keys, ttl=ttl, default=default)
+        return self.__memory_accessor__.get_list_data(keys, ttl=ttl, default=default)
+
     def create_proxy(self, proxy_name):
         """
         Create a proxy as a member variable. Variable name will be the same as the proxy_name. E.g. 
-        `proxy_name=ALFaceDetection` will create `self.ALFaceDetection`.
+        `proxy_name=ALFaceDetection` will create `self.ALFaceDetection`. Proxies are shared between all instances via
+        the process wide registry, so a proxy that already exists is reused instead of created again.
         :param proxy_name: The name of the proxy as a string 
         """
         if not isinstance(proxy_name, str):
             raise TypeError("Proxy names have to be string objects.")
-        while not self.__is_shutdown:
-            try:
-                setattr(self, proxy_name, ALProxy(proxy_name))
-                break
-            except RuntimeError:
-                print "Server '%s' could not be found. Maybe it is not running, yet. Retrying." % proxy_name
-                time.sleep(1.)
+        proxy = self._registry.get_proxy(proxy_name, lambda: self.__is_shutdown)
+        if proxy is not None:
+            setattr(self, proxy_name, proxy)
+            self._proxy_names.add(proxy_name)
+
+    def cancel(self):
+        """
+        Aborts the creation of proxies whose module is not running, yet, so a thread initialising this event returns
+        instead of retrying forever. Called by the EventManager if the events could not be started in time.
+        """
+        self.__is_shutdown = True
+
+    def is_cancelled(self):
+        """
+        :return: True if `cancel` was called
+        """
+        return self.__is_shutdown
 
     @abstractmethod
     def callback(self, *args, **kwargs):
@@ -116,12 +411,37 @@ class EventAbstractclass(ALModule):
         except RuntimeError:
             raise RuntimeError("The broker instance has to be created before you can create a proxy.")
 
-        self.__memory__ = self._make_global("memory", ALProxy("ALMemory"))
+        # Managers of other robots may replace the global concurrently, so keep the own proxy
+        self.__memory__ = self._registry.get_proxy("ALMemory", lambda: self.__is_shutdown)
+        self._make_global("memory", self.__memory__)
+        self.__memory_accessor__ = MemoryAccessor(self.__memory__, ttl=self.memory_ttl)
         if self.__proxy_name__ is not None:
             self.create_proxy(self.__proxy_name__)
 
         self.sync_global(glob)
 
+    def reconnect(self):
+        """
+        Registers this module with a new broker, creates the memory and all proxies again, and restores all
+        subscriptions made directly in NAOqi. Called by the EventManager after the connection to the robot was rebuilt.
+        """
+        try:
+            super(EventAbstractclass, self).__init__(self._name)
+        except RuntimeError:
+            raise RuntimeError("The broker instance has to be created before you can create a proxy.")
+        self.__memory__ = self._registry.get_proxy("ALMemory")
+        self._make_global("memory", self.__memory__)
+        self.__memory_accessor__.memory = self.__memory__
+        self.__memory_accessor__.invalidate()
+        for proxy_name in list(self._proxy_names):
+            self.create_proxy(proxy_name)
+        for event, method in self._subscriptions.items():
+            self.__memory__.subscribeToEvent(
+                event,
+                self._name,
+                method
+            )
+
     def init(self, *args):
         """
         Override this function to call proxy functions etc. before the spinner subscribes to the event.
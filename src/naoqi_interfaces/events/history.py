@@ -0,0 +1,74 @@
+from naoqi_interfaces.events.ring_buffer import RingBuffer
+import threading
+import time
+
+
+class EventHistory(object):
+    """
+    The latest values of an event with their time of arrival, kept in a preallocated ring buffer. Thread-safe, so the
+    values appended on the NAOqi callback thread can be read by the tasks of `EventManager.spin` without calling
+    ALMemory.
+
+    :param size: The maximum number of values kept
+    :param max_age: Optional argument. The maximum age in seconds of the values returned by the queries. Older values
+    are ignored, even if they are still in the buffer.
+    """
+    def __init__(self, size=100, max_age=None):
+        self.size = size
+        self.max_age = max_age
+        self.__buffer = RingBuffer(size)
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.since(0.))
+
+    def append(self, value, timestamp=None):
+        """
+        :param value: The value of the event
+        :param timestamp: Optional argument. The time of arrival. If omitted, the current time is used.
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        with self.__lock:
+            if not self.__buffer.append(timestamp, value):
+                # The clock went backwards. Keep the order instead of losing the value.
+                self.__buffer.append(self.__buffer.latest()[0], value)
+
+    def _oldest(self):
+        return None if self.max_age is None else time.time() - self.max_age
+
+    def latest(self):
+        """
+        :return: The latest tuple (timestamp, value) or None if there is none (within `max_age`)
+        """
+        with self.__lock:
+            latest = self.__buffer.latest()
+        oldest = self._oldest()
+        if latest is None or (oldest is not None and latest[0] < oldest):
+            return None
+        return latest
+
+    def since(self, timestamp):
+        """
+        :param timestamp: The time in seconds since the epoch
+        :return: A list of all tuples (timestamp, value) received at or after the given time, oldest first
+        """
+        oldest = self._oldest()
+        with self.__lock:
+            return self.__buffer.since(timestamp if oldest is None else max(timestamp, oldest))
+
+    def window(self, seconds):
+        """
+        :param seconds: The length of the window
+        :return: A list of all tuples (timestamp, value) received in the last `seconds`, oldest first
+        """
+        return self.since(time.time() - seconds)
+
+    def values(self):
+        """
+        :return: A list of all values (within `max_age`), oldest first
+        """
+        return [v for _, v in self.since(0.)]
+
+    def clear(self):
+        with self.__lock:
+            self.__buffer.clear()
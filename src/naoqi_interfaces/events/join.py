@@ -0,0 +1,109 @@
+"""
+Combines several events by their time stamps. Used by the MultiEventAbstractclass:
+
+    class Fused(MultiEventAbstractclass):
+        def __init__(self):
+            super(Fused, self).__init__(
+                events=[],
+                joins=[Join(["PeoplePerception/PeopleDetected", "GazeAnalysis/PeopleLookingAtRobot"],
+                            callback="callback_fused", tolerance=.2)]
+            )
+
+        def callback_fused(self, timestamp, values):
+            people, looking = values
+"""
+from naoqi_interfaces.events.ring_buffer import RingBuffer
+import threading
+import time
+
+
+def payload_timestamp(value):
+    """
+    :param value: The value of an event, raw or decoded
+    :return: The time stamp in seconds the value carries, either as a `timestamp` attribute of a decoded value or as
+    [seconds, microseconds] in its first element, or None if it carries none
+    """
+    timestamp = getattr(value, "timestamp", None)
+    if timestamp is not None:
+        return timestamp
+    if isinstance(value, (list, tuple)) and value:
+        first = value[0]
+        if isinstance(first, (list, tuple)) and len(first) == 2 \
+                and all(isinstance(v, (int, long)) and not isinstance(v, bool) for v in first):
+            return first[0] + first[1] * 1e-6
+    return None
+
+
+class Join(object):
+    """
+    Fires one callback with a value of every event whenever samples of all events with time stamps within the
+    tolerance of each other are available. Every stream keeps its latest samples in a fixed size ring buffer, so a
+    stream that fires much more often than the others does not grow the memory. Samples that were part of a fired
+    combination, and all older ones, are not used again.
+
+    :param events: The list of event names to combine
+    :param callback: The function or method name `callback(timestamp, values)`. `values` is a tuple of the values in
+    the order of `events`, decoded if the event has a decoder. `timestamp` is the time stamp of the latest of them.
+    :param tolerance: The maximum difference in seconds between the time stamps of the combined samples
+    :param capacity: The number of samples buffered per event
+    :param use_payload_time: If True, the time stamps carried by the values are used, see `payload_timestamp`. As soon
+    as a value of any of the events carries none, the join falls back to the time of arrival for all events, because
+    the clocks of the robot and this computer cannot be compared. If False, the time of arrival is used.
+    :param name: Optional argument. The name used for dispatching and statistics. If omitted, the event names joined
+    by "+" are used.
+    """
+    def __init__(self, events, callback, tolerance=.1, capacity=100, use_payload_time=False, name=None):
+        if len(events) < 2:
+            raise ValueError("A join needs at least two events.")
+        if len(set(events)) != len(events):
+            raise ValueError("The events of a join have to be unique.")
+        self.events = tuple(events)
+        self.callback = callback
+        self.tolerance = tolerance
+        self.use_payload_time = use_payload_time
+        self.name = "+".join(events) if name is None else name
+        self.fired = 0
+        self.__buffers = dict((e, RingBuffer(capacity)) for e in events)
+        self.__lock = threading.Lock()
+
+    def add(self, event, value, timestamp=None):
+        """
+        Adds a sample and looks for a matching combination including it.
+
+        :param event: The name of the event
+        :param value: The value
+        :param timestamp: Optional argument. The time of arrival. If omitted, the current time is used.
+        :return: None or a tuple (timestamp, values) if the sample completed a combination
+        """
+        arrival = time.time() if timestamp is None else timestamp
+        with self.__lock:
+            timestamp = payload_timestamp(value) if self.use_payload_time else None
+            if timestamp is None:
+                timestamp = arrival
+                if self.use_payload_time:
+                    # The buffered samples use the clock of the robot and cannot be matched with this one
+                    print "Warning: '%s' carries no time stamp, the join '%s' uses the time of arrival instead." % (
+                        event, self.name)
+                    self.use_payload_time = False
+                    for b in self.__buffers.values():
+                        b.clear()
+            if not self.__buffers[event].append(timestamp, value):
+                return None
+            matches = []
+            for e in self.events:
+                match = (timestamp, value) if e == event else self.__buffers[e].nearest(timestamp, self.tolerance)
+                if match is None:
+                    return None
+                matches.append(match)
+            # All samples have to be within the tolerance of each other, not only of the new one
+            if max(m[0] for m in matches) - min(m[0] for m in matches) > self.tolerance:
+                return None
+            for e, m in zip(self.events, matches):
+                self.__buffers[e].discard_until(m[0])
+            self.fired += 1
+        return max(m[0] for m in matches), tuple(m[1] for m in matches)
+
+    def clear(self):
+        with self.__lock:
+            for b in self.__buffers.values():
+                b.clear()
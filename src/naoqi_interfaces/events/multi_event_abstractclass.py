@@ -1,11 +1,24 @@
 from event_abstractclass import EventAbstractclass
+from naoqi_interfaces.events.join import Join
 from abc import ABCMeta
+from collections import OrderedDict
+import threading
 import types
 
 
 class Event(list):
-    def __init__(self, event_name=None, proxy_name=None, callback=None):
+    def __init__(self, event_name=None, proxy_name=None, callback=None, decoder=None):
+        """
+        The description of an event for the MultiEventAbstractclass.
+
+        :param event_name: The name of the event, e.g. "FaceDetected"
+        :param proxy_name: The name of the proxy that provides the event, e.g. "ALFaceDetection"
+        :param callback: The callback as a method or its name as a string
+        :param decoder: Optional argument. True to hand the callback the value decoded by the decoder registered for
+        the event, or a function decoding the value. See naoqi_interfaces.events.decoders.
+        """
         super(Event, self).__init__((event_name, proxy_name, callback))
+        self.decoder = decoder
 
     @property
     def event_name(self):
@@ -23,15 +36,37 @@ class Event(list):
 class MultiEventAbstractclass(EventAbstractclass):
     __metaclass__ = ABCMeta
 
-    def __init__(self, events, name=""):
+    def __init__(self, events, name="", joins=None):
         """
         Constructor for multi subscription class. This allow to subscribe to multiple events in the same class.
         
-        :param events: A list of tuples `[(event_name, proxy_name, callback), ...]`
+        :param events: A list of tuples `[(event_name, proxy_name, callback), ...]`. The callback can be None for
+        events only used in joins.
         :param name: Option argument. Can be used to define an explicit name fo the global variable that holds the 
         instance of the inheriting class. If not defined `inst.__class__.__name__+"_inst"` will be used
+        :param joins: Optional argument. A list of naoqi_interfaces.events.join.Join combining several events into one
+        callback by their time stamps. Events of a join that are not in `events` are subscribed without a callback of
+        their own.
         """
         super(MultiEventAbstractclass, self).__init__(event=None, proxy_name=None, name=name)
+        self._check_events(events)
+
+        joins = [] if joins is None else joins
+        for j in joins:
+            if not isinstance(j, Join):
+                raise TypeError("Elements in joins have to be a Join")
+            if not isinstance(j.callback, (types.FunctionType, types.MethodType, types.UnboundMethodType, str)):
+                raise TypeError("Callbacks have to be function objects or strings.")
+
+        self.events = events
+        self.joins = joins
+        self._joins = {}
+        self._active = {}
+        self._started = False
+        self.__reconfigure_lock = threading.Lock()
+
+    @staticmethod
+    def _check_events(events):
         if not (isinstance(events, (list, tuple))):
             raise TypeError("events has to be a list or tuple")
         for e in events:
@@ -42,38 +77,138 @@ class MultiEventAbstractclass(EventAbstractclass):
             if not isinstance(e[0], str):
                 raise TypeError("Event names have to be string objects.")
             if not isinstance(e[2], (types.FunctionType, types.BuiltinFunctionType, types.MethodType,
-                                     types.BuiltinMethodType, types.UnboundMethodType, str)):
-                raise TypeError("Callbacks have to be function objects or strings.")
+                                     types.BuiltinMethodType, types.UnboundMethodType, str, types.NoneType)):
+                raise TypeError("Callbacks have to be function objects, strings, or None.")
+            if getattr(e, "decoder", None) not in (None, True, False) and not callable(e.decoder):
+                raise TypeError("Decoders have to be functions, True, or None.")
 
-        self.events = events
+    def _desired(self, events):
+        """
+        :param events: A list of event descriptions as given to the constructor
+        :return: A dictionary mapping the event names to tuples (proxy_name, callback, decoder), including the events
+        only subscribed for joins
+        """
+        desired = OrderedDict((e[0], (e[1], e[2], getattr(e, "decoder", None))) for e in events)
+        for j in self.joins:
+            for e in j.events:
+                desired.setdefault(e, (None, None, None))
+        return desired
+
+    def _add(self, event, description):
+        if description[0] is not None and not hasattr(self, description[0]):
+            self.create_proxy(description[0])
+        self._subscribe_event(event, description[1], description[2])
+        self._active[event] = description
+
+    def _remove(self, event):
+        self._unsubscribe_event(event)
+        self._active.pop(event, None)
 
     def _subscribe(self):
-        for e in self.events:
-            self.__memory__.subscribeToEvent(
-                e[0],
-                self._name,
-                e[2].func_name if not isinstance(e[2], str) else e[2]
-            )
-
-    def subscribe(self, event, callback):
-        self.__memory__.subscribeToEvent(
-            event,
-            self._name,
-            callback.func_name if not isinstance(callback, str) else callback
-        )
+        self._joins = {}
+        for j in self.joins:
+            callback = getattr(self, j.callback if isinstance(j.callback, str) else j.callback.func_name)
+            for e in j.events:
+                self._joins.setdefault(e, []).append((j, callback))
+            if self._dispatcher is not None:
+                self._dispatcher.register((self._name, j.name), *self._dispatch_policies.get(
+                    j.name, self._dispatch_policies.get(None, (None, None))))
+        self._started = True
+        for event, description in self._desired(self.events).items():
+            self._add(event, description)
+
+    def subscribe(self, event, callback, decoder=None):
+        self._add(event, (None, callback, decoder))
 
     def _unsubscribe(self):
-        for e in self.events:
-            self.__memory__.unsubscribeToEvent(
-                e[0],
-                self._name
-            )
+        self._started = False
+        errors = self._apply([(e, self._remove, (e,)) for e in self._active.keys()])
+        for j in self.joins:
+            j.clear()
+        if errors:
+            raise RuntimeError("Could not unsubscribe '%s' from: %s" % (
+                self._name, ", ".join("%s: %s" % (e, str(error)) for e, error in errors)))
+
+    def set_events(self, events):
+        """
+        Changes the events this class is subscribed to. Only the differences to the current subscriptions are applied:
+        events that are not in the new list are unsubscribed, new events are subscribed, and events that are in both
+        only get their callback and decoder replaced locally. All subscriptions and unsubscriptions are made
+        concurrently. Calling this again with the same list does nothing, so after an error it can simply be retried.
+        If called before `start`, the list is used when starting.
+
+        :param events: A list of event descriptions like in the constructor
+        :return: A dictionary with the lists of event names that were "added", "removed", and "updated"
+        :raises RuntimeError: If not all changes could be made. All others are applied.
+        """
+        self._check_events(events)
+        with self.__reconfigure_lock:
+            self.events = events
+            if not self._started:
+                return {"added": [], "removed": [], "updated": []}
+            desired = self._desired(events)
+            removed = sorted(e for e in self._active if e not in desired)
+            added = sorted(e for e in desired if e not in self._active)
+            updated = sorted(e for e in desired if e in self._active and desired[e] != self._active[e])
+            changes = [(e, self._remove, (e,)) for e in removed]
+            for e in added:
+                changes.append((e, self._add, (e, desired[e])))
+            for e in updated:
+                if self._subscriptions.get(e, self.on_event.func_name) != self.on_event.func_name:
+                    # NAOqi calls the old callback directly, so the subscription has to be replaced
+                    changes.append((e, self._replace, (e, desired[e])))
+                else:
+                    if desired[e][0] is not None:
+                        self.create_proxy(desired[e][0])
+                    self._set_callback(e, desired[e][1], desired[e][2])
+                    self._active[e] = desired[e]
+            errors = self._apply(changes)
+        if errors:
+            raise RuntimeError("Could not change the subscriptions of '%s': %s" % (
+                self._name, ", ".join("%s: %s" % (e, str(error)) for e, error in errors)))
+        return {"added": added, "removed": removed, "updated": updated}
+
+    def _replace(self, event, description):
+        self._remove(event)
+        self._add(event, description)
+
+    @staticmethod
+    def _apply(changes):
+        """
+        Runs the given changes concurrently, one thread each.
+
+        :param changes: A list of tuples (event name, function, arguments)
+        :return: A list of tuples (event name, exception) for the changes that failed
+        """
+        errors = []
+
+        def run(event, func, args):
+            try:
+                func(*args)
+            except Exception as e:
+                errors.append((event, e))
+
+        threads = [threading.Thread(target=run, args=change) for change in changes]
+        for t in threads:
+            t.daemon = True
+            t.start()
+        for t in threads:
+            t.join()
+        return errors
+
+    def _deliver(self, event, args):
+        args = super(MultiEventAbstractclass, self)._deliver(event, args)
+        if args is None:
+            # The event is paused
+            return None
+        for join, callback in self._joins.get(event, ()):
+            fused = join.add(event, args[1])
+            if fused is not None:
+                self._run_callback(join.name, callback, fused)
+        return args
 
     def unsubscribe(self, event):
-        self.__memory__.unsubscribeToEvent(
-            event,
-            self._name
-        )
+        self._remove(event)
 
     def callback(self, *args, **kwargs):
         # Overriding this from EventAbstractclass so we do not require to have one in the inheriting class.
@@ -0,0 +1,111 @@
+class RingBuffer(object):
+    """
+    A fixed size buffer of time stamped values. The storage is allocated once, so memory stays the same no matter how
+    many values are appended; when full, the oldest value is overwritten. Time stamps have to be appended in
+    non-decreasing order which allows all look ups by time to use a binary search. Not thread-safe.
+
+    :param capacity: The maximum number of values
+    """
+    def __init__(self, capacity):
+        if capacity < 1:
+            raise ValueError("The capacity of a ring buffer has to be at least 1.")
+        self.capacity = capacity
+        self.__timestamps = [0.] * capacity
+        self.__values = [None] * capacity
+        self.__start = 0
+        self.__len = 0
+
+    def __len__(self):
+        return self.__len
+
+    def __iter__(self):
+        for i in xrange(self.__len):
+            yield self._get(i)
+
+    def _index(self, i):
+        return (self.__start + i) % self.capacity
+
+    def _get(self, i):
+        j = self._index(i)
+        return self.__timestamps[j], self.__values[j]
+
+    def _bisect(self, timestamp):
+        # The number of values with a time stamp lower than the given one
+        lo, hi = 0, self.__len
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.__timestamps[self._index(mid)] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def append(self, timestamp, value):
+        """
+        :param timestamp: The time stamp of the value in seconds. Has to be greater or equal to the latest time stamp.
+        :param value: The value
+        :return: False if the value was not appended because its time stamp is older than the latest one
+        """
+        if self.__len and timestamp < self.__timestamps[self._index(self.__len - 1)]:
+            return False
+        if self.__len < self.capacity:
+            j = self._index(self.__len)
+            self.__len += 1
+        else:
+            j = self.__start
+            self.__start = (self.__start + 1) % self.capacity
+        self.__timestamps[j] = timestamp
+        self.__values[j] = value
+        return True
+
+    def latest(self, n=None):
+        """
+        :param n: Optional argument. The number of values to return.
+        :return: The latest tuple (timestamp, value) or None if the buffer is empty. If `n` is given, a list of the
+        latest `n` tuples, oldest first.
+        """
+        if n is None:
+            return self._get(self.__len - 1) if self.__len else None
+        return [self._get(i) for i in xrange(max(0, self.__len - n), self.__len)]
+
+    def since(self, timestamp):
+        """
+        :param timestamp: The time stamp in seconds
+        :return: A list of all tuples (timestamp, value) with a time stamp greater or equal to the given one, oldest
+        first
+        """
+        return [self._get(i) for i in xrange(self._bisect(timestamp), self.__len)]
+
+    def nearest(self, timestamp, tolerance=None):
+        """
+        :param timestamp: The time stamp in seconds
+        :param tolerance: Optional argument. The maximum difference in seconds.
+        :return: The tuple (timestamp, value) with the time stamp closest to the given one, or None if the buffer is
+        empty or no time stamp is within the tolerance.
+        """
+        if not self.__len:
+            return None
+        i = self._bisect(timestamp)
+        candidates = [self._get(j) for j in (i - 1, i) if 0 <= j < self.__len]
+        best = min(candidates, key=lambda c: abs(c[0] - timestamp))
+        if tolerance is not None and abs(best[0] - timestamp) > tolerance:
+            return None
+        return best
+
+    def discard_until(self, timestamp):
+        """
+        Removes all values with a time stamp lower or equal to the given one.
+
+        :param timestamp: The time stamp in seconds
+        """
+        n = self._bisect(timestamp)
+        while n < self.__len and self.__timestamps[self._index(n)] <= timestamp:
+            n += 1
+        for i in xrange(n):
+            self.__values[self._index(i)] = None
+        self.__start = self._index(n)
+        self.__len -= n
+
+    def clear(self):
+        self.discard_until(float("inf"))
+        self.__start = 0
@@ -0,0 +1,185 @@
+from naoqi_interfaces.services.service_proxy import ServiceProxy
+import time
+
+
+class FutureTimeout(RuntimeError):
+    pass
+
+
+class FutureCancelled(RuntimeError):
+    pass
+
+
+class ServiceFuture(object):
+    """
+    The handle of a call started via NAOqi's post mechanism. NAOqi does not return the result of posted calls, so
+    `result` only reports when the call has finished.
+
+    :param proxy: The proxy the call was posted to
+    :param task_id: The ID returned by the post call
+    :param name: The name of the call, e.g. "ALTextToSpeech.say"
+    :param timeout: Optional argument. The time in seconds after which the call is considered to have failed.
+    """
+    def __init__(self, proxy, task_id, name, timeout=None):
+        self.proxy = proxy
+        self.task_id = task_id
+        self.name = name
+        self.started = time.time()
+        self.deadline = None if timeout is None else self.started + timeout
+        self.__finished = False
+        self.__cancelled = False
+
+    def __repr__(self):
+        return "<ServiceFuture %s id=%s %s>" % (
+            self.name, str(self.task_id),
+            "cancelled" if self.__cancelled else "finished" if self.__finished else "running")
+
+    def done(self):
+        """
+        :return: True if the call has finished or was cancelled
+        """
+        if not (self.__finished or self.__cancelled):
+            self.__finished = not self.proxy.isRunning(self.task_id)
+        return self.__finished or self.__cancelled
+
+    def cancelled(self):
+        return self.__cancelled
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the call has finished, the given timeout has passed, or the deadline of the call has passed.
+
+        :param timeout: Optional argument. The maximum time to wait in seconds. If omitted, only the deadline given
+        when the call was made applies.
+        :return: True if the call has finished or was cancelled
+        """
+        if self.done():
+            return True
+        remaining = [t for t in (timeout, None if self.deadline is None else self.deadline - time.time())
+                     if t is not None]
+        if remaining:
+            remaining = min(remaining)
+            if remaining <= 0:
+                return False
+            # NAOqi interprets a timeout of 0 as waiting forever, so always wait at least one millisecond
+            self.__finished = self.proxy.wait(self.task_id, max(1, int(remaining * 1000)))
+        else:
+            self.__finished = self.proxy.wait(self.task_id, 0)
+        return self.__finished or self.__cancelled
+
+    def result(self, timeout=None):
+        """
+        Blocks until the call has finished.
+
+        :param timeout: Optional argument. The maximum time to wait in seconds.
+        :return: None, NAOqi does not return the results of posted calls.
+        :raises FutureTimeout: If the call did not finish in time
+        :raises FutureCancelled: If the call was cancelled
+        """
+        finished = self.wait(timeout)
+        if self.__cancelled:
+            raise FutureCancelled("Call '%s' was cancelled." % self.name)
+        if not finished:
+            raise FutureTimeout("Call '%s' did not finish in time." % self.name)
+        return None
+
+    def cancel(self):
+        """
+        Asks NAOqi to stop the call.
+
+        :return: False if the call had already finished, True otherwise
+        """
+        if self.done():
+            return False
+        self.proxy.stop(self.task_id)
+        self.__cancelled = True
+        return True
+
+
+class AsyncServiceProxy(ServiceProxy):
+    def __init__(self, proxy_name, timeout=None, registry=None):
+        """
+        Creates a proxy whose calls do not block. Every call is posted to NAOqi and immediately returns a
+        ServiceFuture, so several independent calls can run at the same time:
+
+        speech = AsyncServiceProxy("ALAnimatedSpeech")
+        motion = AsyncServiceProxy("ALMotion")
+        gather(speech.say("Hello"), motion.angleInterpolation("HeadYaw", .5, 1., True), timeout=5.)
+
+        Use `call` to give a single call its own timeout. The blocking proxy is still available via `proxy`.
+
+        :param proxy_name: The name of the proxy to create, e.g. ALAnimatedSpeech
+        :param timeout: Optional argument. The default time in seconds after which calls are considered to have failed.
+        :param registry: Optional argument. The ProxyRegistry of the robot to talk to. If omitted, the process wide
+        registry is used.
+        """
+        super(AsyncServiceProxy, self).__init__(proxy_name, registry)
+        self.timeout = timeout
+
+    def __getattr__(self, item):
+        if item.startswith("__") or "proxy_name" not in self.__dict__:
+            raise AttributeError(item)
+        if item == self.proxy_name:
+            return self.proxy
+
+        def post(*args):
+            return self.call(item, *args)
+        post.__name__ = item
+        return post
+
+    def call(self, method, *args, **kwargs):
+        """
+        Posts a call to NAOqi.
+
+        :param method: The name of the method, e.g. "say"
+        :param args: The arguments of the method
+        :param timeout: Keyword argument. The time in seconds after which the call is considered to have failed.
+        If omitted, the default timeout of this proxy is used.
+        :return: A ServiceFuture
+        """
+        timeout = kwargs.pop("timeout", self.timeout)
+        if kwargs:
+            raise TypeError("call() got unexpected keyword arguments: %s" % ", ".join(kwargs))
+        proxy = self.registry.get_proxy(self.proxy_name)
+        task_id = getattr(proxy.post, method)(*args)
+        return ServiceFuture(proxy, task_id, "%s.%s" % (self.proxy_name, method), timeout=timeout)
+
+
+def wait(futures, timeout=None):
+    """
+    Waits for several calls at the same time.
+
+    :param futures: A list of ServiceFutures
+    :param timeout: Optional argument. The maximum time to wait for all of them in seconds.
+    :return: A tuple of two lists: the futures that have finished and the ones that have not
+    """
+    deadline = None if timeout is None else time.time() + timeout
+    for f in futures:
+        f.wait(None if deadline is None else max(0., deadline - time.time()))
+    done = [f for f in futures if f.done()]
+    return done, [f for f in futures if f not in done]
+
+
+def gather(*futures, **kwargs):
+    """
+    Waits until all the given calls have finished.
+
+    :param futures: ServiceFutures
+    :param timeout: Keyword argument. The maximum time to wait for all of them in seconds.
+    :param cancel_on_timeout: Keyword argument. If True, calls that have not finished when the timeout has passed are
+    cancelled. Default is False.
+    :return: The list of results. See ServiceFuture.result.
+    :raises FutureTimeout: If not all calls finished in time
+    :raises FutureCancelled: If one of the calls was cancelled
+    """
+    timeout = kwargs.pop("timeout", None)
+    cancel_on_timeout = kwargs.pop("cancel_on_timeout", False)
+    if kwargs:
+        raise TypeError("gather() got unexpected keyword arguments: %s" % ", ".join(kwargs))
+    done, pending = wait(futures, timeout)
+    if pending:
+        if cancel_on_timeout:
+            for f in pending:
+                f.cancel()
+        raise FutureTimeout("Calls did not finish in time: %s" % ", ".join(f.name for f in pending))
+    return [f.result(0) for f in futures]
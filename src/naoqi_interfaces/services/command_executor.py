@@ -0,0 +1,285 @@
+from naoqi_interfaces.services.service_proxy import ServiceProxy
+import naoqi_interfaces.comms.proxy_registry as proxies
+import heapq
+import itertools
+import threading
+import time
+import traceback
+
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+EXPIRED = "expired"
+SUPERSEDED = "superseded"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+
+
+class CommandDropped(RuntimeError):
+    pass
+
+
+class Command(object):
+    """
+    A call queued in the CommandExecutor. Created by `CommandExecutor.submit`.
+    """
+    def __init__(self, proxy_name, method, args, priority, deadline, key, interruptible):
+        self.proxy_name = proxy_name
+        self.method = method
+        self.args = args
+        self.priority = priority
+        self.deadline = deadline
+        self.key = key
+        self.interruptible = interruptible
+        self.name = "%s.%s" % (proxy_name, method)
+        self.submitted = time.time()
+        self.state = PENDING
+        self.task_id = None
+        self.__result = None
+        self.__error = None
+        self.__finished = threading.Event()
+
+    def __repr__(self):
+        return "<Command %s priority=%d %s>" % (self.name, self.priority, self.state)
+
+    def _finish(self, state, result=None, error=None):
+        self.state = state
+        self.__result = result
+        self.__error = error
+        self.__finished.set()
+
+    def done(self):
+        """
+        :return: True if the command was executed or dropped
+        """
+        return self.__finished.is_set()
+
+    def wait(self, timeout=None):
+        """
+        :param timeout: Optional argument. The maximum time to wait in seconds.
+        :return: True if the command was executed or dropped
+        """
+        return self.__finished.wait(timeout)
+
+    def result(self, timeout=None):
+        """
+        Blocks until the command was executed.
+
+        :param timeout: Optional argument. The maximum time to wait in seconds.
+        :return: The return value of the call. None for interruptible commands, see `CommandExecutor.submit`.
+        :raises CommandDropped: If the command expired, was superseded, cancelled, or interrupted, or did not finish
+        within the timeout
+        """
+        if not self.wait(timeout):
+            raise CommandDropped("Command '%s' did not finish in time." % self.name)
+        if self.__error is not None:
+            raise self.__error
+        if self.state != DONE:
+            raise CommandDropped("Command '%s' was %s." % (self.name, self.state))
+        return self.__result
+
+    def cancel(self):
+        """
+        Removes the command from the queue.
+
+        :return: False if the command is already running or finished
+        """
+        if self.state != PENDING:
+            return False
+        self._finish(CANCELLED)
+        return True
+
+
+class _Lane(object):
+    """
+    A queue of commands and the worker thread executing them one after the other.
+    """
+    def __init__(self, executor, name):
+        self.executor = executor
+        self.name = name
+        self.cond = threading.Condition()
+        self.heap = []
+        self.keys = {}
+        self.running = None
+        self.stopped = False
+        self.executed = 0
+        self.dropped = 0
+        self.thread = threading.Thread(target=self.run, name="commands-%s" % name)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def put(self, command, preempt):
+        with self.cond:
+            if self.stopped:
+                command._finish(CANCELLED)
+                return
+            if command.key is not None:
+                previous = self.keys.get(command.key)
+                if previous is not None and previous.state == PENDING:
+                    previous._finish(SUPERSEDED)
+                    self.dropped += 1
+                self.keys[command.key] = command
+            heapq.heappush(self.heap, (command.priority, next(self.executor.counter), command))
+            running = self.running
+            self.cond.notify()
+        if preempt and running is not None and running.interruptible and running.priority > command.priority \
+                and running.task_id is not None:
+            running.state = INTERRUPTED
+            try:
+                self.executor.registry.get_proxy(running.proxy_name).stop(running.task_id)
+            except RuntimeError as e:
+                print "Warning: Could not interrupt '%s': %s" % (running.name, e)
+
+    def _next(self):
+        with self.cond:
+            while True:
+                while self.heap and not self.stopped:
+                    command = heapq.heappop(self.heap)[2]
+                    if self.keys.get(command.key) is command:
+                        del self.keys[command.key]
+                    if command.state != PENDING:
+                        continue
+                    if command.deadline is not None and time.time() > command.deadline:
+                        command._finish(EXPIRED)
+                        self.dropped += 1
+                        continue
+                    command.state = RUNNING
+                    self.running = command
+                    return command
+                if self.stopped:
+                    return None
+                self.cond.wait()
+
+    def run(self):
+        while True:
+            command = self._next()
+            if command is None:
+                return
+            try:
+                if command.interruptible:
+                    proxy = self.executor.registry.get_proxy(command.proxy_name)
+                    command.task_id = getattr(proxy.post, command.method)(*command.args)
+                    if command.state == RUNNING:
+                        proxy.wait(command.task_id, 0)
+                    result = None
+                else:
+                    result = getattr(ServiceProxy(command.proxy_name, self.executor.registry), command.method)(
+                        *command.args)
+                command._finish(DONE if command.state == RUNNING else command.state, result)
+            except Exception as e:
+                if command.state == INTERRUPTED:
+                    command._finish(INTERRUPTED)
+                else:
+                    print "Exception in command '%s':" % command.name
+                    traceback.print_exc()
+                    command._finish(FAILED, error=e)
+            with self.cond:
+                self.running = None
+                self.executed += 1
+
+    def stop(self, timeout=None):
+        with self.cond:
+            self.stopped = True
+            for _, _, command in self.heap:
+                if command.state == PENDING:
+                    command._finish(CANCELLED)
+            self.heap = []
+            self.keys.clear()
+            self.cond.notify_all()
+        if self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def stats(self):
+        with self.cond:
+            return {
+                "queued": sum(1 for _, _, c in self.heap if c.state == PENDING),
+                "running": None if self.running is None else self.running.name,
+                "executed": self.executed,
+                "dropped": self.dropped
+            }
+
+
+class CommandExecutor(object):
+    """
+    Executes calls to NAOqi modules ordered by priority instead of in the order they were made. Every proxy gets its
+    own lane with its own worker thread, so a long call to one module, e.g. an animated `say`, does not delay the
+    calls to other modules:
+
+    commands = CommandExecutor()
+    commands.submit("ALAnimatedSpeech", "say", "Hello", priority=LOW)
+    commands.submit("ALMotion", "setAngles", "HeadYaw", .5, .1, key="look", deadline=.5)
+    commands.submit("ALMotion", "stopMove", priority=HIGH)
+
+    :param registry: Optional argument. The ProxyRegistry of the robot. If omitted, the process wide registry is used.
+    """
+    def __init__(self, registry=None):
+        self.registry = proxies.registry if registry is None else registry
+        self.counter = itertools.count()
+        self.__lock = threading.Lock()
+        self.__lanes = {}
+        self.__stopped = False
+
+    def submit(self, proxy_name, method, *args, **kwargs):
+        """
+        Queues a call.
+
+        :param proxy_name: The name of the proxy, e.g. "ALMotion"
+        :param method: The name of the method, e.g. "setAngles"
+        :param args: The arguments of the method
+        :param priority: Keyword argument. HIGH, NORMAL (default), LOW, or any other number. Lower numbers are
+        executed first, commands of the same priority in the order they were submitted.
+        :param deadline: Keyword argument. The time in seconds after which the command is dropped if it has not been
+        started, yet.
+        :param key: Keyword argument. A pending command of the same lane with the same key is dropped in favour of
+        this one, e.g. to only execute the latest target of the head.
+        :param lane: Keyword argument. The name of the lane. If omitted, the proxy name is used.
+        :param interruptible: Keyword argument. If True, the call is started via NAOqi's post mechanism so it can be
+        stopped by a preempting command. NAOqi does not return the results of posted calls.
+        :param preempt: Keyword argument. If True, a running interruptible command of a lower priority in the same
+        lane is stopped.
+        :return: The Command
+        """
+        priority = kwargs.pop("priority", NORMAL)
+        deadline = kwargs.pop("deadline", None)
+        key = kwargs.pop("key", None)
+        lane = kwargs.pop("lane", proxy_name)
+        interruptible = kwargs.pop("interruptible", False)
+        preempt = kwargs.pop("preempt", False)
+        if kwargs:
+            raise TypeError("submit() got unexpected keyword arguments: %s" % ", ".join(kwargs))
+        command = Command(proxy_name, method, args, priority,
+                          None if deadline is None else time.time() + deadline, key, interruptible)
+        with self.__lock:
+            if self.__stopped:
+                raise RuntimeError("The command executor has been stopped.")
+            if lane not in self.__lanes:
+                self.__lanes[lane] = _Lane(self, lane)
+            lane = self.__lanes[lane]
+        lane.put(command, preempt)
+        return command
+
+    def stop(self, timeout=None):
+        """
+        Drops all pending commands and waits for the running ones to finish.
+
+        :param timeout: Optional argument. The maximum time in seconds to wait for each lane.
+        """
+        with self.__lock:
+            self.__stopped = True
+            lanes = self.__lanes.values()
+        for lane in lanes:
+            lane.stop(timeout)
+
+    def stats(self):
+        """
+        :return: A dictionary mapping the lane names to the number of queued, executed, and dropped commands and the
+        name of the running command
+        """
+        with self.__lock:
+            lanes = dict(self.__lanes)
+        return dict((name, lane.stats()) for name, lane in lanes.items())
@@ -1,28 +1,46 @@
-from naoqi import ALProxy
+import naoqi_interfaces.comms.proxy_registry as proxies
+import naoqi_interfaces.control.stats as stats
+
+_timed_methods = {}
 
 
 class ServiceProxy(object):
-    def __init__(self, proxy_name):
+    def __init__(self, proxy_name, registry=None):
         """
         Creates a proxy for simple service calls. Proxies can be called in different ways:
-        
+
         service = ServiceProxy("ALAnimatedSpeech")
         service.ALAnimatedSpeech.say("test")
         service.proxy.say("test")
         service.say("test")
-        
-        All do the same.
-        
+
+        All do the same. The underlying proxy is shared with all other users of the same proxy name in this process.
+
         :param proxy_name: The name of the proxy to create, e.g. ALAnimatedSpeech
+        :param registry: Optional argument. The ProxyRegistry of the robot to talk to. If omitted, the process wide
+        registry is used.
         """
         if not isinstance(proxy_name, str):
             raise TypeError("Proxy names have to be string objects.")
         self.proxy_name = proxy_name
-        setattr(self, proxy_name, ALProxy(proxy_name))
+        self.registry = proxies.registry if registry is None else registry
+        self.registry.get_proxy(proxy_name)
 
     def __getattr__(self, item):
-        return getattr(self.proxy, item)
+        if item.startswith("__") or "proxy_name" not in self.__dict__:
+            raise AttributeError(item)
+        if item == self.proxy_name:
+            return self.proxy
+        method = self.registry.get_method(self.proxy_name, item)
+        if not stats.collector.enabled:
+            return method
+        key = (self.registry, self.proxy_name, item)
+        timed = _timed_methods.get(key)
+        if timed is None or timed.__wrapped__ is not method:
+            timed = _timed_methods[key] = stats.collector.timed("%s.%s" % key[1:], method)
+            timed.__wrapped__ = method
+        return timed
 
     @property
     def proxy(self):
-        return getattr(self, self.proxy_name)
+        return self.registry.get_proxy(self.proxy_name)
@@ -0,0 +1,250 @@
+"""
+An in-process stand-in for the `naoqi` module. It provides `ALBroker`, `ALProxy`, and `ALModule` and a simulated
+`ALMemory` so the classes of this package can be used and measured without a robot. Call `install()` before importing
+anything from naoqi_interfaces:
+
+    import naoqi_interfaces.testing.fake_naoqi as fake_naoqi
+    fake_naoqi.install()
+    from naoqi_interfaces.control.event_manager import EventManager
+    ...
+    fake_naoqi.robot.memory.raiseEvent("FaceDetected", [...])
+
+Events are delivered synchronously on the thread calling `raiseEvent`.
+"""
+import itertools
+import sys
+import threading
+import time
+import traceback
+
+
+class FakeRobot(object):
+    """
+    The simulated robot all fake brokers, modules, and proxies of this process talk to.
+
+    :param latency: Time in seconds every call to a proxy takes. Can be changed at any time.
+    """
+    def __init__(self, latency=0.):
+        self.latency = latency
+        self.reachable = True
+        self.available_modules = None
+        self.brokers = []
+        self.modules = {}
+        self.calls = []
+        self.record_calls = False
+        self.memory = FakeMemory(self)
+
+    def check(self, name="robot"):
+        """
+        Simulates a round trip to the robot. Raises a RuntimeError if it cannot be reached.
+        """
+        if not self.reachable or not self.brokers:
+            raise RuntimeError("Cannot reach '%s'" % name)
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    def reset(self):
+        """
+        Removes all brokers, modules, subscriptions, and data.
+        """
+        self.__init__(self.latency)
+
+
+class FakeMemory(object):
+    """
+    A simulated ALMemory supporting data access and event subscriptions.
+    """
+    def __init__(self, robot):
+        self.robot = robot
+        self.data = {}
+        self.subscribers = {}
+        self.__lock = threading.Lock()
+
+    def subscribeToEvent(self, event, module_name, callback_name):
+        self.robot.check("ALMemory")
+        with self.__lock:
+            self.subscribers.setdefault(event, {})[module_name] = callback_name
+
+    def unsubscribeToEvent(self, event, module_name):
+        self.robot.check("ALMemory")
+        with self.__lock:
+            if module_name not in self.subscribers.get(event, {}):
+                raise RuntimeError("Module '%s' is not subscribed to '%s'" % (module_name, event))
+            del self.subscribers[event][module_name]
+
+    def getSubscribers(self, event):
+        return self.subscribers.get(event, {}).keys()
+
+    def getEventList(self):
+        return self.subscribers.keys()
+
+    def raiseEvent(self, event, value):
+        """
+        Stores the value and calls all subscribed modules with (event, value, subscriber identifier) like NAOqi does.
+        Like NAOqi, an exception in one module is printed and does not keep the value from the other modules.
+        """
+        self.data[event] = value
+        with self.__lock:
+            subscribers = self.subscribers.get(event, {}).items()
+        for module_name, callback_name in subscribers:
+            try:
+                getattr(self.robot.modules[module_name], callback_name)(event, value, module_name)
+            except Exception:
+                print "Exception in module '%s' for '%s':" % (module_name, event)
+                traceback.print_exc()
+
+    def insertData(self, key, value):
+        self.robot.check("ALMemory")
+        self.data[key] = value
+
+    def insertListData(self, pairs):
+        self.robot.check("ALMemory")
+        for key, value in pairs:
+            self.data[key] = value
+
+    def getData(self, key):
+        self.robot.check("ALMemory")
+        try:
+            return self.data[key]
+        except KeyError:
+            raise RuntimeError("ALMemory::getData: Data '%s' not found." % key)
+
+    def getListData(self, keys):
+        self.robot.check("ALMemory")
+        missing = [k for k in keys if k not in self.data]
+        if missing:
+            raise RuntimeError("ALMemory::getListData: Data '%s' not found." % missing[0])
+        return [self.data[k] for k in keys]
+
+    def removeData(self, key):
+        self.data.pop(key, None)
+
+    def ping(self):
+        self.robot.check("ALMemory")
+        return True
+
+
+class _Post(object):
+    def __init__(self, proxy):
+        self.__proxy = proxy
+
+    def __getattr__(self, item):
+        if item.startswith("__"):
+            raise AttributeError(item)
+        method = getattr(self.__proxy, item)
+
+        def post(*args):
+            return self.__proxy._post(method, args)
+        return post
+
+
+class FakeProxy(object):
+    """
+    A simulated proxy of any module except ALMemory. Every method exists, takes any arguments, and returns None.
+    Calls are recorded in `robot.calls` if `robot.record_calls` is True. `post.<method>` runs the method on a
+    background thread and returns a task ID that can be used with `wait`, `stop`, and `isRunning`.
+    """
+    _ids = itertools.count(1)
+
+    def __init__(self, robot, name):
+        self._robot = robot
+        self._name = name
+        self._tasks = {}
+        self.post = _Post(self)
+
+    def __getattr__(self, item):
+        if item.startswith("__"):
+            raise AttributeError(item)
+
+        def method(*args):
+            self._robot.check(self._name)
+            if self._robot.record_calls:
+                self._robot.calls.append((self._name, item, args))
+        method.__name__ = item
+        return method
+
+    def _post(self, method, args):
+        task_id = next(self._ids)
+        done = threading.Event()
+        self._tasks[task_id] = done
+
+        def run():
+            try:
+                method(*args)
+            finally:
+                done.set()
+        t = threading.Thread(target=run)
+        t.daemon = True
+        t.start()
+        return task_id
+
+    def wait(self, task_id, timeout_ms):
+        done = self._tasks.get(task_id)
+        if done is None:
+            return True
+        return done.wait(None if timeout_ms <= 0 else timeout_ms / 1000.)
+
+    def isRunning(self, task_id):
+        done = self._tasks.get(task_id)
+        return done is not None and not done.is_set()
+
+    def stop(self, task_id):
+        # The simulated calls cannot be interrupted, the task is just forgotten
+        done = self._tasks.pop(task_id, None)
+        if done is not None:
+            done.set()
+
+    def ping(self):
+        self._robot.check(self._name)
+        return True
+
+
+robot = FakeRobot()
+
+
+class ALBroker(object):
+    def __init__(self, name, ip, port, parent_ip, parent_port):
+        if not robot.reachable:
+            raise RuntimeError("Cannot connect to %s:%s" % (parent_ip, str(parent_port)))
+        self.name = name
+        robot.brokers.append(self)
+
+    def shutdown(self):
+        if self in robot.brokers:
+            robot.brokers.remove(self)
+
+
+class ALModule(object):
+    def __init__(self, name):
+        if not robot.brokers:
+            raise RuntimeError("No broker")
+        self.__module_name = name
+        robot.modules[name] = self
+
+    def __del__(self):
+        pass
+
+    def getName(self):
+        return self.__module_name
+
+    def ping(self):
+        return True
+
+
+def ALProxy(name, *args):
+    robot.check(name)
+    if name == "ALMemory":
+        return robot.memory
+    if robot.available_modules is not None and name not in robot.available_modules:
+        raise RuntimeError("Module '%s' not found" % name)
+    return FakeProxy(robot, name)
+
+
+def install():
+    """
+    Makes `import naoqi` return this module. Has to be called before anything from naoqi_interfaces is imported.
+
+    :return: The simulated robot
+    """
+    sys.modules["naoqi"] = sys.modules[__name__]
+    return robot
@@ -0,0 +1,47 @@
+from naoqi_interfaces.testing import fake_naoqi
+robot = fake_naoqi.install()
+
+from naoqi_interfaces.control.event_manager import EventManager
+from naoqi_interfaces.events.event_abstractclass import EventAbstractclass
+import unittest
+
+
+class FailingEvent(EventAbstractclass):
+    def callback(self, *args, **kwargs):
+        raise ValueError("Failing on purpose")
+
+
+class RecordingEvent(EventAbstractclass):
+    def __init__(self, *args, **kwargs):
+        super(RecordingEvent, self).__init__(*args, **kwargs)
+        self.received = []
+
+    def callback(self, *args, **kwargs):
+        self.received.append(args[1])
+
+
+class TestEventBus(unittest.TestCase):
+    def tearDown(self):
+        self.manager.shutdown()
+        robot.reset()
+
+    def start(self, use_event_bus):
+        self.failing = FailingEvent(event="Event", proxy_name=None)
+        self.recording = RecordingEvent(event="Event", proxy_name=None)
+        self.manager = EventManager(globals(), "127.0.0.1", 9559, events=[self.failing, self.recording],
+                                    auto_reconnect=False, install_signal_handler=False, use_event_bus=use_event_bus)
+
+    def test_failing_handler_does_not_stop_others(self):
+        self.start(use_event_bus=True)
+        robot.memory.raiseEvent("Event", 1)
+        robot.memory.raiseEvent("Event", 2)
+        self.assertEqual(self.recording.received, [1, 2])
+
+    def test_failing_handler_without_bus(self):
+        self.start(use_event_bus=False)
+        robot.memory.raiseEvent("Event", 1)
+        self.assertEqual(self.recording.received, [1])
+
+
+if __name__ == "__main__":
+    unittest.main()